@@ -0,0 +1,96 @@
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.abspath(os.path.join(HERE, ".."))
+DAG_FILE = "etl_pipeline.py"
+
+# libraries a DAG parse should not have to load
+HEAVY = ["pandas", "numpy", "pyarrow", "rapidfuzz", "sqlalchemy", "googleapiclient", "google.oauth2",
+         "MySQLdb", "airflow.providers.mysql"]
+
+# runs in a fresh interpreter per measurement, the way a scheduler parse process starts cold
+PROBE = """
+import importlib.util, json, os, resource, sys, time
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+dags, path, heavy = sys.argv[1], sys.argv[2], json.loads(sys.argv[3])
+sys.path.insert(0, dags)
+import airflow.decorators  # every DAG file pays for airflow itself, not counted
+
+before = set(sys.modules)
+rss = rss_mb()
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location("etl_pipeline_probe", path)
+spec.loader.exec_module(importlib.util.module_from_spec(spec))
+print(json.dumps({
+    "seconds": time.perf_counter() - start,
+    "rss_mb": rss_mb() - rss,
+    "modules": len(set(sys.modules) - before),
+    "heavy": [name for name in heavy if name in sys.modules],
+}))
+"""
+
+
+def measure(dags_dir, runs):
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", PROBE, dags_dir, os.path.join(dags_dir, DAG_FILE), json.dumps(HEAVY)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        samples.append(json.loads(out.strip().splitlines()[-1]))
+    return {
+        "seconds": round(statistics.median(s["seconds"] for s in samples), 4),
+        "rss_mb": round(statistics.median(s["rss_mb"] for s in samples), 1),
+        "modules": samples[-1]["modules"],
+        "heavy": samples[-1]["heavy"],
+        "runs": runs,
+    }
+
+
+def extract_rev(rev, target):
+    # the dags folder as of a git revision, to measure "before"
+    archive = subprocess.run(["git", "archive", rev, "dags"], cwd=ROOT, check=True, capture_output=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(target)
+    return os.path.join(target, "dags")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure etl_pipeline DAG import time and memory.")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per measurement, median reported")
+    parser.add_argument("--rev", default=None, help="git revision to compare against, e.g. HEAD~1")
+    parser.add_argument("--output", default=None, help="write the results as json")
+    args = parser.parse_args()
+
+    results = {"current": measure(os.path.join(ROOT, "dags"), args.runs)}
+    if args.rev:
+        with tempfile.TemporaryDirectory(prefix="etl_dag_rev_") as tmp:
+            results[args.rev] = measure(extract_rev(args.rev, tmp), args.runs)
+
+    for name, r in results.items():
+        print(f"{name:>10}: {r['seconds'] * 1000:8.1f} ms, {r['rss_mb']:6.1f} MB, {r['modules']:5d} modules, "
+              f"heavy: {', '.join(r['heavy']) or 'none'}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import pyarrow as pa
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "dags"))
+sys.path.insert(0, HERE)
+
+from etl.defaults import DRIVE_CHUNK_SIZE  # noqa: E402
+from etl.drive import FORMATS, drive_service, export_merged, upload_file  # noqa: E402
+from fake_drive import FakeDrive  # noqa: E402
+from synthetic import generate, parse_size  # noqa: E402
+
+
+def run_format(drive, service, table, csv_path, fmt, chunksize, retries):
+    # first upload, an unchanged re-upload that must be skipped, then the content must round-trip
+    record = {}
+    start = time.perf_counter()
+    path, mimetype = export_merged(table, csv_path, fmt)
+    record["encode_s"] = round(time.perf_counter() - start, 3)
+    record["bytes"] = os.path.getsize(path)
+
+    received = drive.stats["bytes_received"]
+    start = time.perf_counter()
+    first = upload_file(service, path, mimetype, chunksize=chunksize, retries=retries, backoff=0.05)
+    record["upload_s"] = round(time.perf_counter() - start, 3)
+    record["sent_bytes"] = drive.stats["bytes_received"] - received
+    record["chunks"], record["retries"] = first["chunks"], first["retries"]
+
+    second = upload_file(service, export_merged(table, csv_path, fmt)[0], mimetype, chunksize=chunksize,
+                         retries=retries)
+    with open(path, "rb") as f:
+        record["ok"] = second["action"] == "skipped" and drive.content(first["id"]) == f.read()
+    return record
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload the export in each format to a local Drive stand-in.")
+    parser.add_argument("--rows", default="100k", help="synthetic spotify rows in the exported table")
+    parser.add_argument("--formats", nargs="+", default=list(FORMATS))
+    parser.add_argument("--chunksize", type=int, default=DRIVE_CHUNK_SIZE)
+    parser.add_argument("--retries", type=int, default=5)
+    parser.add_argument("--fail-rate", type=float, default=0.1, help="share of chunk PUTs the stand-in fails")
+    parser.add_argument("--output", default=None, help="write the results as json")
+    args = parser.parse_args()
+
+    drive = FakeDrive(fail_rate=args.fail_rate).start()
+    service = drive_service(endpoint=drive.endpoint)
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory(prefix="etl_drive_") as workdir:
+            csv_path = os.path.join(workdir, "spotify_grammy_full.csv")
+            table = pa.Table.from_pandas(generate(parse_size(args.rows))[0], preserve_index=False)
+            for fmt in args.formats:
+                results[fmt] = run_format(drive, service, table, csv_path, fmt, args.chunksize, args.retries)
+            csv_bytes = os.path.getsize(csv_path) if os.path.exists(csv_path) else None
+    finally:
+        drive.stop()
+
+    for fmt, r in results.items():
+        r["ratio"] = round(csv_bytes / r["bytes"], 2) if csv_bytes else None
+        print(f"{fmt:>8}: {r['bytes'] / 1024 ** 2:7.1f} MB (x{r['ratio']}), encode {r['encode_s']:6.2f}s, "
+              f"upload {r['upload_s']:6.2f}s, {r['chunks']} chunks, {r['retries']} retries, "
+              f"{'ok' if r['ok'] else 'FAILED'}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    if not all(r["ok"] for r in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
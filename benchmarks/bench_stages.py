@@ -0,0 +1,172 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import pandas as pd
+import pyarrow as pa
+import sqlalchemy
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "dags"))
+sys.path.insert(0, HERE)
+
+from etl.transform import clean_spotify_rows, resolve_duplicates, consolidate_albums  # noqa: E402
+from etl.aggregates import aggregate_ddl  # noqa: E402
+from etl.artifacts import write_arrow, open_arrow  # noqa: E402
+from etl.engines import clean_spotify_engine  # noqa: E402
+from etl.matching import MatchCache  # noqa: E402
+from etl.metrics import StageMetrics  # noqa: E402
+from etl.star import build_star  # noqa: E402
+from etl.stages import clean_grammy_keyed, normalize_sources, match_sources, merge_sources, write_merged_csv, fact_delta, load_star  # noqa: E402
+from synthetic import generate, parse_size  # noqa: E402
+
+# a stage is slower than the baseline when it takes this much longer (and more than MIN_SECONDS)
+TOLERANCE = 1.25
+MIN_SECONDS = 0.05
+
+
+def _sqlite_tables(engine, dims, fact):
+    # the warehouse DDL is mysql only, sqlite gets the same columns from the frames
+    for table, frame in list(dims.items()) + [("fact_track_metrics", fact)]:
+        frame.iloc[:0].to_sql(table, engine, index=False, if_exists="replace")
+
+
+def run_size(n, seed, rates, workdir, engines=()):
+    metrics = StageMetrics("bench")
+    spotify, grammy = generate(n, seed=seed, **rates)
+    print(f"{n} spotify rows, {len(grammy)} grammy rows")
+
+    with metrics.stage("cleaning", len(spotify)) as r:
+        df = clean_spotify_rows(spotify)
+        r["rows_out"] = len(df)
+    with metrics.stage("dedup", len(df)) as r:
+        df = resolve_duplicates(df)
+        r["rows_out"] = len(df)
+    with metrics.stage("consolidation", len(df)) as r:
+        sp = consolidate_albums(df)
+        r["rows_out"] = len(sp)
+    # the other engines run clean + dedup + consolidation in one go from the raw parquet and
+    # must give exactly the pandas frame (and so the same spotify_grammy_full.csv)
+    raw_path = os.path.join(workdir, f"spotify_raw_{n}.parquet")
+    if engines:
+        spotify.to_parquet(raw_path, index=False)
+        reference = clean_spotify_engine(raw_path, "pandas")
+    for engine in engines:
+        with metrics.stage(f"clean_{engine}", len(spotify)) as r:
+            other = clean_spotify_engine(raw_path, engine, spill_dir=workdir)
+            r["rows_out"] = len(other)
+        r["parity"] = bool(other.equals(reference) and list(other.dtypes) == list(reference.dtypes))
+        if not r["parity"]:
+            print(f"{engine} output differs from pandas")
+    with metrics.stage("grammy_clean", len(grammy)) as r:
+        gr = clean_grammy_keyed(grammy).drop_duplicates(subset="grammy_uk").reset_index(drop=True)
+        r["rows_out"] = len(gr)
+    with metrics.stage("normalization", len(sp) + len(gr)) as r:
+        sp, gr = normalize_sources(sp, gr)
+        r["rows_out"] = len(sp) + len(gr)
+    # cold run fills a fresh match cache, the warm run is what an unchanged daily run costs
+    cache_path = os.path.join(workdir, f"matches_{n}.sqlite")
+    for name in ("matching", "matching_warm"):
+        cache = MatchCache(path=cache_path).open()
+        with metrics.stage(name, len(sp) + len(gr)) as r:
+            pairs = match_sources(sp, gr, cache=cache)
+            r["rows_out"] = len(pairs)
+            r["matched"] = int(pairs["grammy_nominee"].sum())
+            r["cache"] = cache.report()
+        cache.close()
+    with metrics.stage("merge", len(sp) + len(gr)) as r:
+        merged = merge_sources(sp, gr, pairs)
+        r["rows_out"] = len(merged)
+    with metrics.stage("csv_write", len(merged)) as r:
+        path = write_merged_csv(merged, os.path.join(workdir, "spotify_grammy_full.csv"))
+        r["rows_out"] = len(merged)
+        r["mb"] = round(os.path.getsize(path) / 1024 ** 2, 1)
+    # the typed artifact load_star_schema memory maps, each star table reads its own columns
+    with metrics.stage("arrow_write", len(merged)) as r:
+        _, inserted, _ = fact_delta(merged)
+        arrow_path = os.path.join(workdir, f"merged_{n}.arrow")
+        write_arrow(pa.Table.from_pandas(inserted, preserve_index=False), arrow_path)
+        r["rows_out"] = len(inserted)
+        r["mb"] = round(os.path.getsize(arrow_path) / 1024 ** 2, 1)
+    with metrics.stage("star_sqlite", len(merged)) as r:
+        table = open_arrow(arrow_path)
+        engine = sqlalchemy.create_engine(f"sqlite:///{os.path.join(workdir, 'full_dw.sqlite')}")
+        _sqlite_tables(engine, *build_star(table.slice(0, 0)))
+        stats = load_star(engine, table, recreate=True, ddl=aggregate_ddl(mysql=False))
+        engine.dispose()
+        r["rows_out"] = sum(s["rows"] for s in stats)
+    return metrics.stages
+
+
+def compare(current, baseline, tolerance=TOLERANCE):
+    # prints slower stages, returns how many there are
+    regressions = 0
+    for size, stages in current["results"].items():
+        for stage, record in stages.items():
+            old = baseline.get("results", {}).get(size, {}).get(stage)
+            if not old:
+                continue
+            ratio = record["wall_s"] / old["wall_s"] if old["wall_s"] else float("inf")
+            slower = ratio > tolerance and record["wall_s"] - old["wall_s"] > MIN_SECONDS
+            regressions += slower
+            print(f"{size:>9} {stage:<14} {old['wall_s']:>9.3f}s -> {record['wall_s']:>9.3f}s "
+                  f"x{ratio:.2f} {'REGRESSION' if slower else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark each etl_pipeline stage on synthetic data.")
+    parser.add_argument("--sizes", nargs="+", default=["10k", "100k"], help="10k 100k 1M 10M or row counts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dup-rate", type=float, default=0.15)
+    parser.add_argument("--album-rate", type=float, default=0.1)
+    parser.add_argument("--overlap-rate", type=float, default=0.05)
+    parser.add_argument("--near-rate", type=float, default=0.3)
+    parser.add_argument("--engines", nargs="*", default=[], help="also run the clean stage on these engines, e.g. duckdb")
+    parser.add_argument("--output", default=os.path.join(HERE, "results.json"))
+    parser.add_argument("--baseline", default=None, help="earlier results.json to compare against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    rates = {"dup_rate": args.dup_rate, "album_rate": args.album_rate,
+             "overlap_rate": args.overlap_rate, "near_rate": args.near_rate}
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "seed": args.seed,
+            **rates,
+        },
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory(prefix="etl_bench_") as workdir:
+        for size in args.sizes:
+            report["results"][size] = run_size(parse_size(size), args.seed, rates, workdir, args.engines)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    mismatched = [f"{size} {stage}" for size, stages in report["results"].items()
+                  for stage, record in stages.items() if record.get("parity") is False]
+    if mismatched:
+        print(f"Engine output differs from pandas: {', '.join(mismatched)}")
+        sys.exit(1)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
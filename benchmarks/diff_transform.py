@@ -0,0 +1,88 @@
+import argparse
+import os
+import sys
+
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "dags"))
+sys.path.insert(0, HERE)
+
+from etl.transform import clean_spotify_rows, resolve_duplicates, consolidate_albums  # noqa: E402
+from synthetic import generate, parse_size  # noqa: E402
+
+# differential check of the vectorized dedup/consolidation against the per-group functions the
+# DAG used before (one python call per track_id / track_name + artists), on tie-heavy data
+
+
+def _rows(main_rows, columns):
+    return pd.DataFrame(main_rows, columns=columns).reset_index(drop=True)
+
+
+def resolve_duplicates_apply(df):
+    main_rows = []
+    for _, group in df.groupby("track_id", dropna=False):
+        main_row = group.loc[group["popularity"].idxmax()].copy()
+        main_genre = main_row["main_genre"]
+        subgenres = set(group["sub_genre"].dropna().unique())
+        subgenres = {g for g in subgenres if g != main_genre}
+        main_row["sub_genre"] = ", ".join(sorted(subgenres)) if subgenres else None
+        main_rows.append(main_row)
+    return _rows(main_rows, df.columns)
+
+
+def consolidate_albums_apply(df):
+    main_rows = []
+    for _, group in df.groupby(["track_name", "artists"]):
+        main_row = group.loc[group["popularity"].idxmax()].copy()
+        other_albums = group.loc[group["album_name"] != main_row["album_name"], "album_name"].unique().tolist()
+        main_row["album_others"] = "; ".join(other_albums) if other_albums else None
+        main_rows.append(main_row)
+    return _rows(main_rows, list(df.columns) + ["album_others"])
+
+
+def _comparable(df, dtypes):
+    # the per-group rows come back as object (or inferred str) columns, missing text as None
+    df = df.reset_index(drop=True).astype(dtypes)
+    for col in ("sub_genre", "album_others"):
+        if col in df.columns:
+            df[col] = df[col].astype(object).where(df[col].notna(), None)
+    return df
+
+
+def compare(name, new, old):
+    # same rows in the same order
+    dtypes = new.dtypes.to_dict()
+    try:
+        pd.testing.assert_frame_equal(_comparable(new, dtypes), _comparable(old, dtypes), check_dtype=False)
+    except AssertionError as exc:
+        print(f"{name}: MISMATCH\n{exc}")
+        return False
+    print(f"{name}: {len(new)} rows equal")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare resolve_duplicates/consolidate_albums with the "
+                                                 "per-group reference on synthetic data.")
+    parser.add_argument("--rows", default="20k")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0, 1, 2])
+    parser.add_argument("--ties", type=int, default=5, help="distinct popularity values, fewer means more ties")
+    args = parser.parse_args()
+
+    ok = True
+    for seed in args.seeds:
+        spotify, _ = generate(parse_size(args.rows), seed=seed, dup_rate=0.4, album_rate=0.3)
+        spotify["popularity"] = spotify["popularity"] % args.ties
+        df = clean_spotify_rows(spotify)
+        print(f"seed {seed}: {len(df)} cleaned rows")
+
+        deduped = resolve_duplicates(df)
+        ok &= compare("resolve_duplicates", deduped, resolve_duplicates_apply(df))
+        ok &= compare("consolidate_albums", consolidate_albums(deduped), consolidate_albums_apply(deduped))
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import argparse
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# in-memory stand-in for the parts of the Drive v3 HTTP API load_to_drive uses: files.list
+# by name/parent, resumable files.create / files.update and md5Checksum. fail_rate makes chunk
+# PUTs fail with 503 (after keeping part of the chunk) to exercise the retry/resume path.
+# Point the DAG at it with ETL_DRIVE_ENDPOINT=http://127.0.0.1:<port>/
+
+QUERY_NAME = re.compile(r"name = '((?:[^'\\]|\\.)*)'")
+QUERY_PARENT = re.compile(r"'([^']+)' in parents")
+
+
+class FakeDrive:
+
+    def __init__(self, fail_rate=0.0, seed=0):
+        self.files = {}
+        self.uploads = {}
+        self.fail_rate = fail_rate
+        self.rng = random.Random(seed)
+        self.ids = itertools.count(1)
+        self.stats = {"requests": 0, "bytes_received": 0, "failures": 0, "created": 0, "updated": 0}
+        self.lock = threading.Lock()
+        self.server = None
+
+    def start(self, host="127.0.0.1", port=0):
+        drive = self
+
+        class Handler(_Handler):
+            state = drive
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def endpoint(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def content(self, file_id):
+        return bytes(self.files[file_id]["content"])
+
+
+class _Handler(BaseHTTPRequestHandler):
+    state = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=None, headers=None):
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _public(self, meta):
+        return {k: v for k, v in meta.items() if k != "content"}
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        state = self.state
+        with state.lock:
+            state.stats["requests"] += 1
+            if not url.path.endswith("/drive/v3/files"):
+                return self._send(404, {"error": {"code": 404, "message": url.path}})
+            query = parse_qs(url.query).get("q", [""])[0]
+            name = QUERY_NAME.search(query)
+            parent = QUERY_PARENT.search(query)
+            files = [f for f in state.files.values()
+                     if (not name or f["name"] == re.sub(r"\\(.)", r"\1", name.group(1)))
+                     and (not parent or parent.group(1) in f.get("parents", []))]
+            files.sort(key=lambda f: f["modifiedTime"], reverse=True)
+            self._send(200, {"files": [self._public(f) for f in files]})
+
+    def _start_upload(self, file_id=None):
+        state = self.state
+        url = urlparse(self.path)
+        if parse_qs(url.query).get("uploadType") != ["resumable"]:
+            return self._send(400, {"error": {"code": 400, "message": "only resumable uploads"}})
+        if file_id is not None and file_id not in state.files:
+            return self._send(404, {"error": {"code": 404, "message": f"File not found: {file_id}"}})
+        body = self._body()
+        upload_id = f"u{next(state.ids)}"
+        state.uploads[upload_id] = {"file_id": file_id, "metadata": json.loads(body or b"{}"),
+                                    "mimetype": self.headers.get("X-Upload-Content-Type"), "received": bytearray()}
+        host, port = self.server.server_address[:2]
+        self._send(200, {}, headers={"Location": f"http://{host}:{port}/upload/session/{upload_id}"})
+
+    def do_POST(self):
+        with self.state.lock:
+            self.state.stats["requests"] += 1
+            if urlparse(self.path).path.endswith("/upload/drive/v3/files"):
+                return self._start_upload()
+            self._send(404, {"error": {"code": 404, "message": self.path}})
+
+    def do_PATCH(self):
+        with self.state.lock:
+            self.state.stats["requests"] += 1
+            match = re.search(r"/upload/drive/v3/files/([^/?]+)", urlparse(self.path).path)
+            if match:
+                return self._start_upload(match.group(1))
+            self._send(404, {"error": {"code": 404, "message": self.path}})
+
+    def do_PUT(self):
+        state = self.state
+        data = self._body()
+        with state.lock:
+            state.stats["requests"] += 1
+            upload = state.uploads.get(urlparse(self.path).path.rsplit("/", 1)[-1])
+            if upload is None:
+                return self._send(404, {"error": {"code": 404, "message": "unknown upload session"}})
+            received = upload["received"]
+            content_range = self.headers.get("Content-Range", "")
+            status = re.match(r"bytes \*/(\d+|\*)", content_range)
+            chunk = re.match(r"bytes (\d+)-(\d+)/(\d+|\*)", content_range)
+            if status:
+                total = status.group(1)
+            elif chunk:
+                start, total = int(chunk.group(1)), chunk.group(3)
+                if start > len(received):
+                    return self._send(400, {"error": {"code": 400, "message": "gap in upload"}})
+                if data and state.fail_rate and state.rng.random() < state.fail_rate:
+                    # a dropped connection mid-chunk: part of it arrived, the client must ask where to resume
+                    kept = data[:state.rng.randrange(len(data))]
+                    del received[start:]
+                    received += kept
+                    state.stats["failures"] += 1
+                    state.stats["bytes_received"] += len(kept)
+                    return self._send(503, {"error": {"code": 503, "message": "backend error"}})
+                del received[start:]
+                received += data
+                state.stats["bytes_received"] += len(data)
+            else:
+                total = str(len(received) + len(data))
+                received += data
+            if total != "*" and len(received) >= int(total):
+                return self._send(200, self._finish(upload))
+            headers = {"Range": f"bytes=0-{len(received) - 1}"} if received else {}
+            self._send(308, None, headers=headers)
+
+    def _finish(self, upload):
+        state = self.state
+        content = bytes(upload["received"])
+        if upload["file_id"] is None:
+            file_id = f"f{next(state.ids)}"
+            meta = {"id": file_id, "name": upload["metadata"].get("name", "untitled"),
+                    "parents": upload["metadata"].get("parents", [])}
+            state.stats["created"] += 1
+        else:
+            file_id = upload["file_id"]
+            meta = state.files[file_id]
+            state.stats["updated"] += 1
+        meta.update({
+            "mimeType": upload["metadata"].get("mimeType") or upload["mimetype"],
+            "md5Checksum": hashlib.md5(content).hexdigest(),
+            "size": str(len(content)),
+            "modifiedTime": time.time(),
+            "content": content,
+        })
+        state.files[file_id] = meta
+        return self._public(meta)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Google Drive v3 upload API.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of chunk uploads answered with 503")
+    args = parser.parse_args()
+    drive = FakeDrive(fail_rate=args.fail_rate).start(port=args.port)
+    print(f"Fake Drive API on {drive.endpoint} (ETL_DRIVE_ENDPOINT={drive.endpoint}), Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        drive.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import argparse
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+# seeded Spotify-shaped and Grammy-shaped data with the same columns as the real sources
+
+SPOTIFY_GENRES = [
+    "acoustic", "alt-rock", "alternative", "ambient", "anime", "black-metal", "blues", "brazil",
+    "chill", "children", "classical", "club", "country", "dance", "deep-house", "disco", "edm",
+    "electronic", "emo", "folk", "funk", "gospel", "grunge", "hard-rock", "hip-hop", "house",
+    "indie-pop", "j-pop", "jazz", "k-pop", "kids", "latin", "latino", "metal", "opera", "piano",
+    "pop", "punk", "r-n-b", "reggae", "rock", "salsa", "sad", "sleep", "soul", "techno", "world-music",
+]
+
+CATEGORIES = [
+    "Record Of The Year", "Album Of The Year", "Song Of The Year", "Best New Artist",
+    "Best Pop Solo Performance", "Best Rock Album", "Best Rap Song", "Best Country Album",
+    "Best Latin Pop Album", "Best Jazz Vocal Album", "Best Dance Recording", "Best R&B Performance",
+]
+
+SYLLABLES = ["ka", "lo", "mi", "ra", "ne", "to", "sa", "vi", "do", "ru", "be", "la", "zo", "fi", "ma",
+             "ge", "no", "ta", "ri", "pe", "so", "lu", "da", "ke", "mo", "shi", "an", "el", "or", "un"]
+
+
+def _vocabulary(size=20_000, seed=12345):
+    # pronounceable pseudo-words, fixed seed so every run shares the vocabulary
+    rng = np.random.default_rng(seed)
+    syllables = np.array(SYLLABLES, dtype=object)
+    words = pd.Series(syllables[rng.integers(0, len(syllables), size * 4)])
+    for _ in range(2):
+        extra = np.where(rng.random(size * 4) < 0.6, syllables[rng.integers(0, len(syllables), size * 4)], "")
+        words = words + extra
+    return pd.unique(words)[:size].astype(object)
+
+
+WORDS = _vocabulary()
+
+SUFFIXES = np.array([" (remastered)", " - live", " (radio edit)", " - acoustic version"], dtype=object)
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+
+
+def parse_size(value):
+    value = str(value).lower().replace("_", "")
+    if value in SIZES:
+        return SIZES[value]
+    match = re.fullmatch(r"(\d+)([km]?)", value)
+    if not match:
+        raise ValueError(f"Unknown size: {value}")
+    return int(match.group(1)) * {"": 1, "k": 1_000, "m": 1_000_000}[match.group(2)]
+
+
+def _phrases(rng, n, vocab, max_words=4):
+    # 1..max_words words per phrase, vectorized: unused trailing slots are empty and stripped
+    lengths = rng.integers(1, max_words + 1, n)
+    out = pd.Series(vocab[rng.integers(0, len(vocab), n)])
+    for slot in range(1, max_words):
+        words = np.where(lengths > slot, vocab[rng.integers(0, len(vocab), n)], "")
+        out = out.str.cat(pd.Series(words), sep=" ")
+    return out.str.strip()
+
+
+def _artists(rng, n, pool):
+    # mostly solo, some "a;b" collaborations like the Spotify dataset
+    names = pd.Series(pool[rng.integers(0, len(pool), n)])
+    collab = rng.random(n) < 0.12
+    second = pd.Series(pool[rng.integers(0, len(pool), n)])
+    return names.where(~collab, names + ";" + second)
+
+
+def _typo(rng, value):
+    # one swapped, dropped or doubled character, the kind of typo only character blocking finds
+    if len(value) < 2:
+        return value
+    pos = int(rng.integers(0, len(value) - 1))
+    kind = int(rng.integers(0, 3))
+    if kind == 0:
+        return value[:pos] + value[pos + 1] + value[pos] + value[pos + 2:]
+    if kind == 1:
+        return value[:pos] + value[pos + 1:]
+    return value[:pos] + value[pos] + value[pos:]
+
+
+def _near_match(rng, values, rate):
+    # case, suffix, punctuation and typo variants that exact matching misses and fuzzy matching catches
+    values = values.copy()
+    picked = np.flatnonzero(rng.random(len(values)) < rate)
+    kind = rng.integers(0, 4, len(picked))
+    sub = values.iloc[picked]
+    sub = sub.where(kind != 0, sub.str.upper())
+    sub = sub.where(kind != 1, sub + SUFFIXES[rng.integers(0, len(SUFFIXES), len(picked))])
+    sub = sub.where(kind != 2, sub.str.replace(r"[^\w\s]", "", regex=True))
+    sub = sub.where(kind != 3, pd.Series([_typo(rng, v) for v in sub], index=sub.index))
+    values.iloc[picked] = sub.to_numpy()
+    return values
+
+
+def generate_grammy(n, seed=0):
+    rng = np.random.default_rng(seed + 1)
+    pool = _phrases(rng, max(50, n // 3), WORDS, max_words=2).str.title().to_numpy(dtype=object)
+    year = rng.integers(1958, 2020, n)
+    stamp = pd.Series(year + 1).astype(str) + "-05-19T05:10:28-07:00"
+    nominee = _phrases(rng, n, WORDS).str.title()
+    artist = pd.Series(pool[rng.integers(0, len(pool), n)])
+    missing = rng.random(n)
+    return pd.DataFrame({
+        "year": year,
+        "title": pd.Series(year - 1957).astype(str) + "th Annual GRAMMY Awards  (" + pd.Series(year).astype(str) + ")",
+        "published_at": stamp,
+        "updated_at": stamp,
+        "category": np.array(CATEGORIES, dtype=object)[rng.integers(0, len(CATEGORIES), n)],
+        "nominee": nominee.where(missing > 0.01),
+        "artist": artist.where(missing > 0.05),
+        "workers": "producer; engineer/mixer; mastering engineer",
+        "img": "https://example.invalid/img.jpg",
+        "winner": True,
+    })
+
+
+def generate_spotify(n, grammy=None, seed=0, dup_rate=0.15, album_rate=0.1, overlap_rate=0.05, near_rate=0.3,
+                     null_rate=0.0001):
+    # dup_rate: rows repeating an existing track_id under another genre (dedup)
+    # album_rate: rows repeating a track_name + artists on another album (consolidation)
+    # overlap_rate: rows whose title/artist come from the grammy nominees
+    # near_rate: share of the overlapping rows that are perturbed instead of exact copies
+    rng = np.random.default_rng(seed)
+    n_dup = int(n * dup_rate)
+    n_album = int(n * album_rate)
+    n_base = n - n_dup - n_album
+
+    pool = _phrases(rng, max(50, n_base // 8), WORDS, max_words=2).str.title().to_numpy(dtype=object)
+    track_name = _phrases(rng, n_base, WORDS).str.title()
+    artists = _artists(rng, n_base, pool)
+
+    if grammy is not None and len(grammy) and overlap_rate > 0:
+        rows = np.flatnonzero(rng.random(n_base) < overlap_rate)
+        source = grammy.dropna(subset=["nominee", "artist"])
+        picks = rng.integers(0, len(source), len(rows))
+        track_name.iloc[rows] = _near_match(rng, source["nominee"].iloc[picks].reset_index(drop=True), near_rate).to_numpy()
+        artists.iloc[rows] = source["artist"].iloc[picks].to_numpy()
+
+    base = pd.DataFrame({
+        "track_id": pd.Series(np.arange(n_base)).map("{:022d}".format).to_numpy(),
+        "artists": artists.to_numpy(),
+        "album_name": pd.Series(rng.integers(0, max(1, n_base // 4), n_base)).map("Album {}".format).to_numpy(),
+        "track_name": track_name.to_numpy(),
+    })
+
+    # same track under more genres, and the same song released on other albums
+    dups = base.iloc[rng.integers(0, n_base, n_dup)]
+    albums = base.iloc[rng.integers(0, n_base, n_album)].copy()
+    albums["track_id"] = pd.Series(np.arange(n_base, n_base + n_album)).map("{:022d}".format).to_numpy()
+    albums["album_name"] = pd.Series(rng.integers(0, max(1, n_base // 4), n_album)).map("Album {}".format).to_numpy()
+    df = pd.concat([base, dups, albums], ignore_index=True)
+    df = df.iloc[rng.permutation(len(df))].reset_index(drop=True)
+
+    for col in ["artists", "album_name", "track_name"]:
+        df.loc[rng.random(n) < null_rate, col] = np.nan
+
+    df.insert(0, "Unnamed: 0", np.arange(n))
+    df["popularity"] = rng.integers(0, 101, n)
+    df["duration_ms"] = rng.integers(30_000, 600_000, n)
+    df["explicit"] = rng.random(n) < 0.09
+    df["danceability"] = rng.random(n).round(3)
+    df["energy"] = rng.random(n).round(3)
+    df["key"] = rng.integers(0, 12, n)
+    df["loudness"] = rng.normal(-8, 5, n).round(3)
+    df["mode"] = rng.integers(0, 2, n)
+    df["speechiness"] = rng.random(n).round(4)
+    df["acousticness"] = rng.random(n).round(4)
+    df["instrumentalness"] = rng.random(n).round(4)
+    df["liveness"] = rng.random(n).round(4)
+    df["valence"] = rng.random(n).round(3)
+    df["tempo"] = rng.normal(120, 25, n).round(3)
+    df["time_signature"] = rng.choice([3, 4, 5], n, p=[0.1, 0.85, 0.05])
+    df["track_genre"] = np.array(SPOTIFY_GENRES, dtype=object)[rng.integers(0, len(SPOTIFY_GENRES), n)]
+    return df
+
+
+def generate(n, grammy_rows=None, seed=0, **rates):
+    # real data has roughly one grammy row per 25 spotify rows
+    grammy = generate_grammy(grammy_rows if grammy_rows is not None else max(500, n // 25), seed=seed)
+    return generate_spotify(n, grammy, seed=seed, **rates), grammy
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic Spotify and Grammy CSVs.")
+    parser.add_argument("--rows", default="100k", help="spotify rows: 10k, 100k, 1M, 10M or a number")
+    parser.add_argument("--grammy-rows", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dup-rate", type=float, default=0.15)
+    parser.add_argument("--album-rate", type=float, default=0.1)
+    parser.add_argument("--overlap-rate", type=float, default=0.05)
+    parser.add_argument("--near-rate", type=float, default=0.3)
+    parser.add_argument("--out", default=os.path.join("data", "synthetic"))
+    args = parser.parse_args()
+
+    spotify, grammy = generate(parse_size(args.rows), grammy_rows=args.grammy_rows, seed=args.seed,
+                               dup_rate=args.dup_rate, album_rate=args.album_rate,
+                               overlap_rate=args.overlap_rate, near_rate=args.near_rate)
+    os.makedirs(args.out, exist_ok=True)
+    spotify.to_csv(os.path.join(args.out, "spotify_dataset.csv"), index=False)
+    grammy.to_csv(os.path.join(args.out, "the_grammy_awards.csv"), index=False)
+    print(f"Wrote {len(spotify)} spotify rows and {len(grammy)} grammy rows to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
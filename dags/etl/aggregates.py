@@ -0,0 +1,249 @@
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+from etl.star import surrogate_key
+
+# summary tables next to fact_track_metrics; dashboards read these instead of scanning the
+# fact. Only groups touched by inserted or deleted fact rows are recomputed after a load.
+
+REFRESH_BATCH = 1000
+
+AGGREGATES = {
+    "agg_genre_year": {
+        "columns": [
+            ("main_genre", "VARCHAR(100) NOT NULL"), ("year", "SMALLINT NOT NULL"),
+            ("track_count", "BIGINT NOT NULL"), ("nominee_count", "BIGINT NOT NULL"),
+            ("avg_popularity", "DOUBLE"), ("avg_energy", "DOUBLE"), ("avg_danceability", "DOUBLE"),
+            ("avg_valence", "DOUBLE"), ("avg_duration_min", "DOUBLE"),
+        ],
+        "primary": ["main_genre", "year"],
+        # covers the "by genre and year" dashboard queries without touching the rows
+        "indexes": {"idx_agg_year_genre": ["year", "main_genre", "track_count", "nominee_count",
+                                           "avg_popularity", "avg_energy"]},
+        "groups": {"main_genre": "g.main_genre", "year": "t.year"},
+        "select": """
+            SELECT g.main_genre, t.year, COUNT(*), SUM(f.grammy_nominee),
+                   AVG(f.popularity), AVG(f.energy), AVG(f.danceability), AVG(f.valence), AVG(f.duration_min)
+            FROM {fact} f
+            JOIN {dim_genre} g ON g.genre_key = f.genre_key
+            JOIN {dim_time} t ON t.time_key = f.time_key
+            {where}
+            GROUP BY g.main_genre, t.year
+        """,
+    },
+    "agg_artist": {
+        "columns": [
+            ("artist_key", "BIGINT NOT NULL"), ("artist_spotify", "TEXT NOT NULL"),
+            ("track_count", "BIGINT NOT NULL"), ("nominee_count", "BIGINT NOT NULL"),
+            ("avg_popularity", "DOUBLE"),
+        ],
+        "primary": ["artist_key"],
+        # top artists by nominations: the index gives the order, names come from the primary key
+        "indexes": {"idx_agg_artist_nominations": ["nominee_count", "track_count", "artist_key"]},
+        "groups": {"artist_key": "f.artist_key"},
+        "select": """
+            SELECT f.artist_key, a.artist_spotify, COUNT(*), SUM(f.grammy_nominee), AVG(f.popularity)
+            FROM {fact} f
+            JOIN {dim_artist} a ON a.artist_key = f.artist_key
+            {where}
+            GROUP BY f.artist_key, a.artist_spotify
+        """,
+    },
+    "agg_grammy_category": {
+        "columns": [
+            ("category", "VARCHAR(128) NOT NULL"),
+            ("track_count", "BIGINT NOT NULL"), ("nominee_count", "BIGINT NOT NULL"),
+            ("avg_popularity", "DOUBLE"), ("avg_energy", "DOUBLE"),
+        ],
+        "primary": ["category"],
+        "indexes": {"idx_agg_category_nominations": ["nominee_count", "category", "track_count"]},
+        "groups": {"category": "gr.category"},
+        "select": """
+            SELECT gr.category, COUNT(*), SUM(f.grammy_nominee), AVG(f.popularity), AVG(f.energy)
+            FROM {fact} f
+            JOIN {dim_grammy} gr ON gr.grammy_key = f.grammy_key
+            {where}
+            GROUP BY gr.category
+        """,
+    },
+}
+
+# read layer over the summary tables; created as views in mysql, used as subqueries by the
+# query functions below so they also work where the views do not exist
+VIEWS = {
+    "v_genre_year": """
+        SELECT main_genre, year, track_count, nominee_count,
+               1.0 * nominee_count / track_count AS nominee_rate,
+               avg_popularity, avg_energy, avg_danceability, avg_valence, avg_duration_min
+        FROM {agg_genre_year}
+    """,
+    "v_genre_nominee_rate": """
+        SELECT main_genre, SUM(track_count) AS track_count, SUM(nominee_count) AS nominee_count,
+               1.0 * SUM(nominee_count) / SUM(track_count) AS nominee_rate,
+               SUM(avg_popularity * track_count) / SUM(track_count) AS avg_popularity,
+               SUM(avg_energy * track_count) / SUM(track_count) AS avg_energy
+        FROM {agg_genre_year}
+        GROUP BY main_genre
+    """,
+    "v_top_artists": """
+        SELECT artist_key, artist_spotify, nominee_count, track_count, avg_popularity
+        FROM {agg_artist}
+        WHERE nominee_count > 0
+    """,
+    "v_grammy_category": """
+        SELECT category, nominee_count, track_count, avg_popularity, avg_energy
+        FROM {agg_grammy_category}
+        WHERE category <> ''
+    """,
+}
+
+SOURCE_TABLES = ["fact_track_metrics", "dim_genre", "dim_time", "dim_artist", "dim_grammy"]
+
+
+def _names(schema=None):
+    # format arguments for the sql templates, schema-qualified when there is one
+    tables = SOURCE_TABLES + list(AGGREGATES) + list(VIEWS)
+    names = {t: f"{schema}.{t}" if schema else t for t in tables}
+    names["fact"] = names["fact_track_metrics"]
+    return names
+
+
+def aggregate_ddl(schema_name=None, mysql=True):
+    # summary tables, their covering indexes and the views
+    names = _names(schema_name)
+    ddl = []
+    for table, spec in AGGREGATES.items():
+        columns = [f"{name} {kind}" for name, kind in spec["columns"]]
+        columns.append(f"PRIMARY KEY ({', '.join(spec['primary'])})")
+        if mysql:
+            columns += [f"INDEX {index} ({', '.join(cols)})" for index, cols in spec["indexes"].items()]
+            ddl.append(f"CREATE TABLE IF NOT EXISTS {names[table]} ({', '.join(columns)}) ENGINE=InnoDB "
+                       f"DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci")
+        else:
+            ddl.append(f"CREATE TABLE IF NOT EXISTS {names[table]} ({', '.join(columns)})")
+            ddl += [f"CREATE INDEX IF NOT EXISTS {index} ON {table} ({', '.join(cols)})"
+                    for index, cols in spec["indexes"].items()]
+    for view, sql in VIEWS.items():
+        create = "CREATE OR REPLACE VIEW" if mysql else "CREATE VIEW IF NOT EXISTS"
+        ddl.append(f"{create} {names[view]} AS {sql.format(**names)}")
+    return ddl
+
+
+# merged columns group_keys reads
+GROUP_COLUMNS = ["main_genre", "year", "artist_spotify", "category"]
+
+
+def group_keys(df):
+    # aggregate groups a prepared merged frame falls into, per summary table
+    return {
+        "agg_genre_year": {"main_genre": set(df["main_genre"].astype(str)),
+                           "year": set(df["year"].astype(int))},
+        "agg_artist": {"artist_key": set(surrogate_key(df, ["artist_spotify"]).tolist())},
+        "agg_grammy_category": {"category": set(df["category"].astype(str))},
+    }
+
+
+def deleted_group_keys(engine, hashes, schema=None):
+    # groups of fact rows about to be deleted, read before the delete runs
+    names = _names(schema)
+    sql = text(f"""
+        SELECT DISTINCT g.main_genre, t.year, f.artist_key, gr.category
+        FROM {names['fact']} f
+        JOIN {names['dim_genre']} g ON g.genre_key = f.genre_key
+        JOIN {names['dim_time']} t ON t.time_key = f.time_key
+        JOIN {names['dim_grammy']} gr ON gr.grammy_key = f.grammy_key
+        WHERE f.row_hash IN :hashes
+    """).bindparams(bindparam("hashes", expanding=True))
+    hashes = [int(h) for h in hashes]
+    frames = []
+    with engine.connect() as conn:
+        for start in range(0, len(hashes), REFRESH_BATCH):
+            frames.append(pd.DataFrame(conn.execute(sql, {"hashes": hashes[start:start + REFRESH_BATCH]}).fetchall(),
+                                       columns=["main_genre", "year", "artist_key", "category"]))
+    found = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(
+        columns=["main_genre", "year", "artist_key", "category"])
+    return {
+        "agg_genre_year": {"main_genre": set(found["main_genre"]), "year": set(found["year"].astype(int))},
+        "agg_artist": {"artist_key": set(found["artist_key"].astype("int64").tolist())},
+        "agg_grammy_category": {"category": set(found["category"])},
+    }
+
+
+def merge_group_keys(*keys):
+    merged = {}
+    for groups in keys:
+        for table, columns in groups.items():
+            for column, values in columns.items():
+                merged.setdefault(table, {}).setdefault(column, set()).update(values)
+    return merged
+
+
+def refresh_aggregates(engine, groups=None, schema=None):
+    # groups=None rebuilds every summary table; otherwise each touched group is deleted and
+    # recomputed from the fact, all in one transaction so readers never see half a refresh
+    names = _names(schema)
+    stats = []
+    with engine.begin() as conn:
+        for table, spec in AGGREGATES.items():
+            columns = ", ".join(name for name, _ in spec["columns"])
+            insert = f"INSERT INTO {names[table]} ({columns}) "
+            if groups is None:
+                conn.execute(text(f"DELETE FROM {names[table]}"))
+                conn.execute(text(insert + spec["select"].format(where="", **names)))
+                stats.append({"table": table, "groups": "all"})
+                continue
+
+            wanted = groups.get(table, {})
+            if not wanted or not all(wanted.get(col) for col in spec["groups"]):
+                stats.append({"table": table, "groups": 0})
+                continue
+            # batches over the first group column, the others are few (years) and go whole
+            first, *rest = spec["groups"]
+            values = {col: sorted(wanted[col]) for col in spec["groups"]}
+            for start in range(0, len(values[first]), REFRESH_BATCH):
+                params = {first: values[first][start:start + REFRESH_BATCH], **{col: values[col] for col in rest}}
+                agg_filter = " AND ".join(f"{col} IN :{col}" for col in spec["groups"])
+                src_filter = " AND ".join(f"{expr} IN :{col}" for col, expr in spec["groups"].items())
+                expanding = [bindparam(col, expanding=True) for col in spec["groups"]]
+                conn.execute(text(f"DELETE FROM {names[table]} WHERE {agg_filter}").bindparams(*expanding), params)
+                conn.execute(text(insert + spec["select"].format(where=f"WHERE {src_filter}", **names))
+                             .bindparams(*expanding), params)
+            stats.append({"table": table, "groups": len(values[first])})
+    return stats
+
+
+def query_view(engine, view, schema=None, where=None, order_by=None, limit=None, params=None):
+    # reads one of VIEWS into a frame; where/order_by are sql over the view's columns
+    sql = f"SELECT * FROM ({VIEWS[view].format(**_names(schema))}) v"
+    if where:
+        sql += f" WHERE {where}"
+    if order_by:
+        sql += f" ORDER BY {order_by}"
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    with engine.connect() as conn:
+        return pd.read_sql(text(sql), conn, params=params or {})
+
+
+def genre_year_stats(engine, schema=None, year_from=None, year_to=None):
+    where, params = [], {}
+    if year_from is not None:
+        where.append("year >= :year_from")
+        params["year_from"] = int(year_from)
+    if year_to is not None:
+        where.append("year <= :year_to")
+        params["year_to"] = int(year_to)
+    return query_view(engine, "v_genre_year", schema, where=" AND ".join(where) or None,
+                      order_by="main_genre, year", params=params)
+
+
+def nominee_rate_by_genre(engine, schema=None):
+    return query_view(engine, "v_genre_nominee_rate", schema, order_by="nominee_rate DESC, main_genre")
+
+
+def top_artists(engine, schema=None, limit=20):
+    return query_view(engine, "v_top_artists", schema, order_by="nominee_count DESC, track_count DESC", limit=limit)
+
+
+def category_stats(engine, schema=None):
+    return query_view(engine, "v_grammy_category", schema, order_by="nominee_count DESC, category")
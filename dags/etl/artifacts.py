@@ -0,0 +1,137 @@
+import os
+import re
+import shutil
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+STAGING_DIR = os.environ.get("ETL_STAGING_DIR", "/opt/airflow/data/staging")
+
+# parquet for most hand-offs; arrow (uncompressed IPC file) for artifacts that are memory
+# mapped by the reader, so only the columns it touches are paged in
+EXTENSIONS = {"parquet": "parquet", "arrow": "arrow"}
+
+
+def _run_name(run_id):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", run_id or "manual")
+
+
+def run_dir(run_id=None):
+    # one folder per dag run so retries and manual triggers don't clobber each other
+    path = os.path.join(STAGING_DIR, _run_name(run_id))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def prune_runs(keep, run_id=None, keep_current=True):
+    # delete all but the `keep` most recently written run folders; with keep_current the given
+    # run's folder is kept on top of those, as a failed run needs its artifacts to be retried
+    if not os.path.isdir(STAGING_DIR):
+        return []
+    current = _run_name(run_id)
+    runs = [entry for entry in os.scandir(STAGING_DIR) if entry.is_dir(follow_symlinks=False)]
+    runs.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    deleted = []
+    for entry in runs[max(keep, 0):]:
+        if keep_current and entry.name == current:
+            continue
+        shutil.rmtree(entry.path, ignore_errors=True)
+        deleted.append(entry.name)
+    return deleted
+
+
+def write_arrow(table, path):
+    # arrow IPC file with the pandas schema embedded, uncompressed so it can be memory mapped
+    with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+
+def open_arrow(path, columns=None):
+    # zero-copy: the table's buffers point into the mapped file, nothing is read up front
+    table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+    return table.select(columns) if columns is not None else table
+
+
+def write_artifact(df, name, run_id=None, fmt="parquet"):
+    path = os.path.join(run_dir(run_id), f"{name}.{EXTENSIONS[fmt]}")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+
+    # write then rename, a half-written file must never look like a valid artifact
+    tmp_path = path + ".tmp"
+    if fmt == "arrow":
+        write_arrow(table, tmp_path)
+    else:
+        pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+
+    return {
+        "path": path,
+        "format": fmt,
+        "rows": table.num_rows,
+        "schema": {field.name: str(field.type) for field in table.schema},
+    }
+
+
+def open_artifact(meta, columns=None):
+    # the artifact as an arrow table; memory mapped for arrow artifacts, read for parquet
+    path = meta["path"]
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Artifact not found: {path}")
+
+    if meta.get("format") == "arrow":
+        table = open_arrow(path, columns)
+    else:
+        table = pq.read_table(path, columns=columns)
+    if table.num_rows != meta["rows"]:
+        raise ValueError(f"Artifact {path} has {table.num_rows} rows, expected {meta['rows']}")
+    return table
+
+
+def read_artifact(meta, columns=None):
+    return open_artifact(meta, columns).to_pandas()
+
+
+def empty_artifact(meta):
+    # zero-row frame with the artifact's columns and dtypes, read from the parquet footer only
+    return pq.ParquetFile(meta["path"]).schema_arrow.empty_table().to_pandas()
+
+
+def write_artifact_chunks(chunks, name, run_id=None):
+    # same as write_artifact, but from an iterator of frames, one chunk in memory at a time
+    path = os.path.join(run_dir(run_id), f"{name}.parquet")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+
+    writer = None
+    rows = 0
+    try:
+        for chunk in chunks:
+            if writer is None:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                writer = pq.ParquetWriter(tmp_path, table.schema)
+            else:
+                table = pa.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False)
+            writer.write_table(table)
+            rows += table.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        raise ValueError(f"No chunks written for artifact {name}")
+    os.replace(tmp_path, path)
+
+    return {
+        "path": path,
+        "format": "parquet",
+        "rows": rows,
+        "schema": {field.name: str(field.type) for field in writer.schema},
+    }
+
+
+def iter_artifact(meta, batch_size=100_000, columns=None):
+    path = meta["path"]
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Artifact not found: {path}")
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size, columns=columns):
+        yield batch.to_pandas()
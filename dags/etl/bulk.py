@@ -0,0 +1,235 @@
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+# rows per executemany call, the mysql drivers rewrite each call into one multi-row INSERT
+BATCH_SIZE = 50_000
+
+# smallest slice worth its own connection in a parallel write
+MIN_SLICE_ROWS = 10_000
+
+# LOAD DATA escaping (FIELDS ESCAPED BY '\\'), backslash first
+TSV_ESCAPES = [("\\", "\\\\"), ("\t", "\\t"), ("\n", "\\n"), ("\r", "\\r"), ("\0", "\\0")]
+TSV_NULL = "\\N"
+
+
+def _qualified(table, schema=None):
+    return f"{schema}.{table}" if schema else table
+
+
+def _tsv_column(col):
+    if pd.api.types.is_bool_dtype(col):
+        out = col.astype("Int8").astype(str)
+    else:
+        out = col.astype(str)
+        if not pd.api.types.is_numeric_dtype(col):
+            for raw, escaped in TSV_ESCAPES:
+                out = out.str.replace(raw, escaped, regex=False)
+    return out.where(col.notna(), TSV_NULL)
+
+
+def write_tsv(df, path):
+    cols = [_tsv_column(df[name]) for name in df.columns]
+    lines = cols[0].str.cat(cols[1:], sep="\t") if cols else pd.Series([], dtype=object)
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        if len(df):
+            f.write("\n".join(lines.tolist()))
+            f.write("\n")
+
+
+def _python_rows(df):
+    # numpy scalars -> python values, NaN -> None, so every DB-API driver accepts them
+    frame = df.astype(object).where(df.notna(), None)
+    return list(frame.itertuples(index=False, name=None))
+
+
+def write_load_data(conn, df, table, schema=None, batch_size=BATCH_SIZE, dialect=None, ignore_duplicates=False,
+                    replace_duplicates=False):
+    # needs local_infile enabled on both the server and the client connection
+    fd, path = tempfile.mkstemp(suffix=".tsv")
+    os.close(fd)
+    try:
+        write_tsv(df, path)
+        cols = ", ".join(f"`{c}`" for c in df.columns)
+        duplicates = "REPLACE " if replace_duplicates else "IGNORE " if ignore_duplicates else ""
+        cursor = conn.cursor()
+        cursor.execute(
+            f"LOAD DATA LOCAL INFILE '{path}' {duplicates}"
+            f"INTO TABLE {_qualified(table, schema)} "
+            "CHARACTER SET utf8mb4 "
+            "FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' "
+            f"LINES TERMINATED BY '\\n' ({cols})"
+        )
+        cursor.close()
+    finally:
+        os.remove(path)
+
+
+def write_executemany(conn, df, table, schema=None, batch_size=BATCH_SIZE, dialect=None, ignore_duplicates=False,
+                      replace_duplicates=False):
+    marker = "?" if dialect is not None and dialect.paramstyle == "qmark" else "%s"
+    sqlite = dialect is not None and dialect.name == "sqlite"
+    insert, update = "INSERT", ""
+    if replace_duplicates and sqlite:
+        insert = "INSERT OR REPLACE"
+    elif replace_duplicates:
+        update = " ON DUPLICATE KEY UPDATE " + ", ".join(f"{c} = VALUES({c})" for c in df.columns)
+    elif ignore_duplicates:
+        insert = "INSERT OR IGNORE" if sqlite else "INSERT IGNORE"
+    cols = ", ".join(df.columns)
+    sql = (f"{insert} INTO {_qualified(table, schema)} ({cols}) "
+           f"VALUES ({', '.join([marker] * len(df.columns))}){update}")
+    cursor = conn.cursor()
+    for start in range(0, len(df), batch_size):
+        cursor.executemany(sql, _python_rows(df.iloc[start:start + batch_size]))
+    cursor.close()
+
+
+WRITERS = {
+    "load_data": write_load_data,
+    "executemany": write_executemany,
+}
+
+
+def _is_mysql(engine):
+    return engine.dialect.name == "mysql"
+
+
+def _set_checks(conn, enabled):
+    cursor = conn.cursor()
+    value = 1 if enabled else 0
+    cursor.execute(f"SET unique_checks = {value}")
+    cursor.execute(f"SET foreign_key_checks = {value}")
+    cursor.close()
+
+
+def _slices(df, workers):
+    # contiguous, disjoint row ranges, none smaller than MIN_SLICE_ROWS
+    parts = max(1, min(int(workers or 1), len(df) // MIN_SLICE_ROWS))
+    bounds = [len(df) * i // parts for i in range(parts + 1)]
+    return [df.iloc[bounds[i]:bounds[i + 1]] for i in range(parts)]
+
+
+def _release(engine, conn, relax_checks):
+    try:
+        if relax_checks and _is_mysql(engine):
+            _set_checks(conn, True)
+    finally:
+        conn.close()
+
+
+def _write_slice(engine, df, table, schema, name, batch_size, relax_checks, ignore_duplicates, replace_duplicates):
+    # writes one slice on its own pooled connection and hands the transaction back uncommitted
+    conn = engine.raw_connection()
+    start = time.perf_counter()
+    try:
+        # only relax checks on data that is already unique and whose parents are loaded
+        if relax_checks and _is_mysql(engine):
+            _set_checks(conn, False)
+        WRITERS[name](conn, df, table, schema=schema, batch_size=batch_size,
+                      dialect=engine.dialect, ignore_duplicates=ignore_duplicates,
+                      replace_duplicates=replace_duplicates)
+    except Exception:
+        conn.rollback()
+        _release(engine, conn, relax_checks)
+        raise
+    return conn, time.perf_counter() - start
+
+
+def _write_slices(engine, slices, table, schema, name, batch_size, relax_checks, ignore_duplicates,
+                  replace_duplicates):
+    # every slice in its own transaction, in parallel when there are several; returns the open
+    # transactions, or rolls all of them back when any slice failed
+    args = (table, schema, name, batch_size, relax_checks, ignore_duplicates, replace_duplicates)
+    written, errors = [], []
+    if len(slices) == 1:
+        try:
+            written.append((slices[0], *_write_slice(engine, slices[0], *args)))
+        except Exception as exc:
+            errors.append(exc)
+    else:
+        with ThreadPoolExecutor(max_workers=len(slices)) as pool:
+            futures = {pool.submit(_write_slice, engine, rows, *args): rows for rows in slices}
+            for future in as_completed(futures):
+                try:
+                    written.append((futures[future], *future.result()))
+                except Exception as exc:
+                    errors.append(exc)
+    if errors:
+        for _, conn, _ in written:
+            conn.rollback()
+            _release(engine, conn, relax_checks)
+        raise errors[0]
+    return written
+
+
+def _commit_slices(engine, written, table, relax_checks, cleanup=None):
+    # commits the slices together once all of them are written; if a commit fails after others
+    # went through, cleanup gets the rows already committed so the table is left as it was
+    committed = 0
+    try:
+        for _, conn, _ in written:
+            conn.commit()
+            committed += 1
+    except Exception:
+        for _, conn, _ in written[committed:]:
+            conn.rollback()
+        if committed:
+            rows = pd.concat([rows for rows, _, _ in written[:committed]])
+            print(f"{table}: commit failed after {committed} of {len(written)} slices ({len(rows)} rows)"
+                  f"{', removing them' if cleanup else ''}")
+            if cleanup is not None:
+                cleanup(rows)
+        raise
+    finally:
+        for _, conn, _ in written:
+            _release(engine, conn, relax_checks)
+    return [(len(rows), seconds) for rows, _, seconds in written]
+
+
+def write_table(engine, df, table, schema=None, method="auto", batch_size=BATCH_SIZE, relax_checks=False,
+                ignore_duplicates=False, replace_duplicates=False, workers=1, cleanup=None):
+    # auto: LOAD DATA on mysql, falling back to batched executemany if the server refuses it.
+    # ignore_duplicates skips rows whose primary/unique key already exists, replace_duplicates
+    # overwrites them with the new values.
+    # workers > 1 (mysql only, sqlite takes one writer at a time) splits the rows into disjoint
+    # slices written concurrently over the engine's connection pool (size it to at least
+    # workers), all or nothing.
+    if method == "auto":
+        methods = ["load_data", "executemany"] if _is_mysql(engine) else ["executemany"]
+    elif method in WRITERS:
+        methods = [method]
+    else:
+        raise ValueError(f"Unknown bulk load method: {method}")
+    slices = _slices(df, workers if _is_mysql(engine) else 1)
+
+    start = time.perf_counter()
+    used = None
+    timings = []
+    if len(df):
+        for i, name in enumerate(methods):
+            try:
+                written = _write_slices(engine, slices, table, schema, name, batch_size, relax_checks,
+                                        ignore_duplicates, replace_duplicates)
+                used = name
+                break
+            except Exception as exc:
+                if i == len(methods) - 1:
+                    raise
+                print(f"{table}: {name} failed ({exc}), falling back to {methods[i + 1]}")
+        timings = _commit_slices(engine, written, table, relax_checks, cleanup)
+
+    elapsed = time.perf_counter() - start
+    rate = len(df) / elapsed if elapsed > 0 else float("inf")
+    print(f"{table}: {len(df)} rows in {elapsed:.2f}s ({rate:,.0f} rows/s, {len(slices)} worker(s)) "
+          f"via {used or 'nothing to load'}")
+    if len(slices) > 1 and used:
+        # a worker's own rate next to the total shows how well the load scales with workers
+        per_worker = sum(rows for rows, _ in timings) / sum(seconds for _, seconds in timings)
+        print(f"{table}: {per_worker:,.0f} rows/s per worker, slowest slice "
+              f"{max(seconds for _, seconds in timings):.2f}s")
+    return {"table": table, "rows": len(df), "seconds": round(elapsed, 3), "rows_per_sec": round(rate, 1),
+            "method": used, "workers": len(slices)}
@@ -0,0 +1,19 @@
+# defaults the DAG file needs at parse time, kept free of imports so parsing stays cheap
+
+# spotify rows per chunk in streaming mode
+CHUNK_SIZE = 100_000
+
+# grammy rows per fetch from the server-side cursor
+GRAMMY_BATCH_SIZE = 50_000
+
+# mapped match_shard tasks
+MATCH_SHARDS = 4
+
+# drive resumable upload chunk, a multiple of 256 KiB
+DRIVE_CHUNK_SIZE = 8 * 1024 * 1024
+
+# parallel connections writing the fact table
+LOAD_WORKERS = 4
+
+# run folders kept in the staging dir, older ones are deleted at the end of a run
+KEEP_RUNS = 3
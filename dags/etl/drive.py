@@ -0,0 +1,159 @@
+import gzip
+import hashlib
+import os
+import random
+import shutil
+import time
+
+from etl.defaults import DRIVE_CHUNK_SIZE
+
+# export of the merged dataset to google drive: the file is encoded (csv, gzip or parquet), its md5
+# compared with the md5Checksum drive keeps for the previous upload, and only sent when it
+# changed, updating that same drive file in place with a chunked, retried resumable upload
+
+FORMATS = {
+    "csv": ("", "text/csv"),
+    "gzip": (".gz", "application/gzip"),
+    "parquet": (".parquet", "application/vnd.apache.parquet"),
+}
+
+# drive wants every chunk but the last to be a multiple of 256 KiB
+CHUNK_GRANULARITY = 256 * 1024
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+MAX_BACKOFF = 60
+
+# another host speaking the drive api instead of google's, e.g. benchmarks/fake_drive.py
+DRIVE_ENDPOINT = os.environ.get("ETL_DRIVE_ENDPOINT") or None
+
+
+def gzip_file(path):
+    # deterministic: no file name or mtime in the header, so unchanged data hashes the same
+    out_path = path + ".gz"
+    tmp_path = out_path + ".tmp"
+    with open(path, "rb") as src, open(tmp_path, "wb") as raw, \
+            gzip.GzipFile(filename="", mode="wb", fileobj=raw, compresslevel=6, mtime=0) as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def export_merged(table, csv_path, fmt="gzip"):
+    # the file to upload and its mimetype, written from the typed merged arrow table: the csv
+    # (as before), the csv gzipped next to it, or parquet straight from the arrow types
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown drive format {fmt!r}, expected one of {', '.join(FORMATS)}")
+    suffix, mimetype = FORMATS[fmt]
+    os.makedirs(os.path.dirname(csv_path) or ".", exist_ok=True)
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        out_path = os.path.splitext(csv_path)[0] + suffix
+        pq.write_table(table, out_path + ".tmp", compression="zstd")
+        os.replace(out_path + ".tmp", out_path)
+        return out_path, mimetype
+
+    from etl.stages import write_merged_csv
+
+    write_merged_csv(table.to_pandas(), csv_path)
+    return (gzip_file(csv_path) if fmt == "gzip" else csv_path), mimetype
+
+
+def file_md5(path):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def drive_service(creds=None, endpoint=None):
+    import json
+    from googleapiclient.discovery import build, build_from_document
+    from googleapiclient.discovery_cache import get_static_doc
+    from googleapiclient.http import build_http
+
+    if endpoint:
+        # upload urls come from the document's rootUrl, api_endpoint alone only moves the metadata calls
+        document = json.loads(get_static_doc("drive", "v3"))
+        document["rootUrl"] = endpoint.rstrip("/") + "/"
+        return build_from_document(document, http=build_http())
+    return build("drive", "v3", credentials=creds, cache_discovery=False)
+
+
+def find_drive_file(service, name, folder_id=None):
+    # most recently modified non-trashed file with this name (in the folder)
+    name = name.replace("\\", "\\\\").replace("'", "\\'")
+    query = f"name = '{name}' and trashed = false"
+    if folder_id:
+        query += f" and '{folder_id}' in parents"
+    found = service.files().list(q=query, orderBy="modifiedTime desc", pageSize=1,
+                                 fields="files(id, name, md5Checksum, size)").execute()
+    files = found.get("files", [])
+    return files[0] if files else None
+
+
+def _retryable(exc):
+    from googleapiclient.errors import HttpError
+    import httplib2
+
+    if isinstance(exc, HttpError):
+        return exc.resp.status in RETRY_STATUSES
+    return isinstance(exc, (OSError, httplib2.HttpLib2Error))
+
+
+def run_resumable(request, retries=5, backoff=1.0, sleep=time.sleep):
+    # sends the upload chunk by chunk; a failed chunk is retried with exponential backoff and
+    # jitter, the client first asks the server how much it got so the upload resumes from there
+    response = None
+    stats = {"chunks": 0, "retries": 0}
+    attempt = 0
+    while response is None:
+        try:
+            _, response = request.next_chunk()
+        except Exception as exc:
+            if attempt >= retries or not _retryable(exc):
+                raise
+            attempt += 1
+            stats["retries"] += 1
+            delay = min(backoff * 2 ** (attempt - 1), MAX_BACKOFF) * random.uniform(0.5, 1.0)
+            print(f"Upload chunk failed ({exc}), retry {attempt}/{retries} in {delay:.1f}s")
+            sleep(delay)
+            continue
+        attempt = 0
+        stats["chunks"] += 1
+    return response, stats
+
+
+def upload_file(service, path, mimetype, name=None, folder_id=None, chunksize=DRIVE_CHUNK_SIZE,
+                retries=5, backoff=1.0, sleep=time.sleep):
+    # create, update in place or skip when drive already holds these exact bytes
+    from googleapiclient.http import MediaFileUpload
+
+    name = name or os.path.basename(path)
+    md5 = file_md5(path)
+    size = os.path.getsize(path)
+    existing = find_drive_file(service, name, folder_id)
+    result = {"name": name, "bytes": size, "md5": md5, "chunks": 0, "retries": 0}
+    if existing and existing.get("md5Checksum") == md5:
+        print(f"Drive file {name} ({existing['id']}) already has md5 {md5}, upload skipped")
+        return {**result, "id": existing["id"], "action": "skipped", "bytes": 0}
+
+    chunksize = max(CHUNK_GRANULARITY, -(-int(chunksize) // CHUNK_GRANULARITY) * CHUNK_GRANULARITY)
+    media = MediaFileUpload(path, mimetype=mimetype, chunksize=chunksize, resumable=True)
+    if existing:
+        request = service.files().update(fileId=existing["id"], body={"mimeType": mimetype},
+                                         media_body=media, fields="id, name, md5Checksum")
+        action = "updated"
+    else:
+        metadata = {"name": name, "mimeType": mimetype}
+        if folder_id:
+            metadata["parents"] = [folder_id]
+        request = service.files().create(body=metadata, media_body=media, fields="id, name, md5Checksum")
+        action = "created"
+
+    response, stats = run_resumable(request, retries=retries, backoff=backoff, sleep=sleep)
+    if response.get("md5Checksum") and response["md5Checksum"] != md5:
+        raise ValueError(f"Drive md5 {response['md5Checksum']} does not match local {md5} for {name}")
+    print(f"Drive file {name} {action} (ID: {response['id']}), {size} bytes in {stats['chunks']} chunks, "
+          f"{stats['retries']} retries")
+    return {**result, **stats, "id": response["id"], "action": action}
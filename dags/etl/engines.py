@@ -0,0 +1,156 @@
+import shutil
+import tempfile
+
+import pyarrow.parquet as pq
+
+from etl.transform import NORMALIZE_MAPPING, GENRE_MAPPING, clean_spotify, clean_spotify_rows, \
+    resolve_duplicates, consolidate_albums
+
+# backends for the spotify clean + dedup + consolidation stage, picked with the "engine" dag
+# param. pandas is the reference; duckdb runs the same steps as one multi-threaded SQL query
+# straight over the raw parquet artifact and spills to disk instead of holding it in memory.
+# Output (rows, order, dtypes) is identical, so everything downstream is engine agnostic.
+
+ENGINES = ("pandas", "duckdb")
+
+DROPPED_COLUMNS = ["Unnamed: 0", "key", "mode", "time_signature", "winner"]
+TEXT_COLUMNS = ["artists", "album_name", "track_name"]
+
+# what python's str.strip() removes, RE2 \s alone misses \v, \x1c-\x1f, \x85 and unicode spaces
+STRIP_PATTERN = r"^[\t-\r\x{1C}-\x{1F}\x{85}\p{Z}]+|[\t-\r\x{1C}-\x{1F}\x{85}\p{Z}]+$"
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _literal(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _genre_values(mapping):
+    return ", ".join(f"({_literal(k)}, {_literal(v)})" for k, v in mapping.items())
+
+
+def spotify_sql(columns, path):
+    # clean_spotify_rows + resolve_duplicates + consolidate_albums in SQL; file_row_number
+    # stands in for the frame position pandas uses to break ties and order joined lists
+    kept = [c for c in columns if c not in DROPPED_COLUMNS]
+    keep = ", ".join(_quote(c) for c in kept)
+    not_null = " AND ".join(f"{_quote(c)} IS NOT NULL" for c in kept)
+
+    out = []
+    for col in kept:
+        if col == "track_genre":
+            continue
+        if col == "duration_ms":
+            out.append("CAST(duration_ms / 60000 AS FLOAT) AS duration_min")
+        elif col == "loudness":
+            out.append("CASE WHEN loudness > 0 THEN CAST(0 AS FLOAT) ELSE loudness END AS loudness")
+        elif col in TEXT_COLUMNS:
+            out.append(f"regexp_replace(lower({_quote(col)}), '{STRIP_PATTERN}', '', 'g') AS {_quote(col)}")
+        else:
+            out.append(_quote(col))
+    out.append("n.genre AS sub_genre")
+    out.append("COALESCE(m.main_genre, n.genre) AS main_genre")
+    body = [c for c in kept if c != "track_genre"]
+    body = [("duration_min" if c == "duration_ms" else c) for c in body] + ["sub_genre", "main_genre"]
+    main_cols = ", ".join(f"m.{_quote(c)}" for c in body)
+
+    return f"""
+        WITH normalize(genre_in, genre_out) AS (VALUES {_genre_values(NORMALIZE_MAPPING)}),
+        genres(sub_genre, main_genre) AS (VALUES {_genre_values(GENRE_MAPPING)}),
+        raw AS (
+            SELECT {keep}, file_row_number AS pos
+            FROM read_parquet({_literal(path)}, file_row_number = true)
+            WHERE {not_null}
+        ),
+        -- drop_duplicates(keep="first") over every kept column
+        deduped AS (
+            SELECT * FROM raw
+            QUALIFY row_number() OVER (PARTITION BY {keep} ORDER BY pos) = 1
+        ),
+        cleaned AS (
+            SELECT {", ".join(out)}, pos
+            FROM (SELECT *, COALESCE(z.genre_out, track_genre) AS genre
+                  FROM deduped LEFT JOIN normalize z ON z.genre_in = track_genre) n
+            LEFT JOIN genres m ON m.sub_genre = n.genre
+        ),
+        -- resolve_duplicates: most popular row per track_id, first one on ties
+        by_track AS (
+            SELECT * FROM cleaned
+            QUALIFY row_number() OVER (PARTITION BY track_id ORDER BY popularity DESC, pos) = 1
+        ),
+        other_genres AS (
+            SELECT c.track_id, string_agg(DISTINCT c.sub_genre, ', ' ORDER BY c.sub_genre) AS sub_genre
+            FROM cleaned c JOIN by_track t ON t.track_id = c.track_id
+            WHERE c.sub_genre <> t.main_genre
+            GROUP BY c.track_id
+        ),
+        tracks AS (
+            SELECT {", ".join("o.sub_genre" if c == "sub_genre" else f"t.{_quote(c)}" for c in body)},
+                   row_number() OVER (ORDER BY t.track_id) AS pos
+            FROM by_track t LEFT JOIN other_genres o ON o.track_id = t.track_id
+        ),
+        -- consolidate_albums: most popular row per track_name + artists, ties by track_id order
+        main AS (
+            SELECT * FROM tracks
+            QUALIFY row_number() OVER (PARTITION BY track_name, artists ORDER BY popularity DESC, pos) = 1
+        ),
+        albums AS (
+            SELECT t.track_name, t.artists, t.album_name, min(t.pos) AS first_pos
+            FROM tracks t JOIN main m ON m.track_name = t.track_name AND m.artists = t.artists
+            WHERE t.album_name <> m.album_name
+            GROUP BY t.track_name, t.artists, t.album_name
+        ),
+        other_albums AS (
+            SELECT track_name, artists, string_agg(album_name, '; ' ORDER BY first_pos) AS album_others
+            FROM albums
+            GROUP BY track_name, artists
+        )
+        SELECT {main_cols}, a.album_others
+        FROM main m LEFT JOIN other_albums a ON a.track_name = m.track_name AND a.artists = m.artists
+        ORDER BY m.track_name, m.artists
+    """
+
+
+def _template(path):
+    # the pandas output for zero rows, carries the exact column order and dtypes
+    empty = pq.ParquetFile(path).schema_arrow.empty_table().to_pandas()
+    return consolidate_albums(resolve_duplicates(clean_spotify_rows(empty)))
+
+
+def clean_spotify_duckdb(path, spill_dir=None, threads=None, memory_limit=None):
+    # spill_dir holds duckdb's temp files when the query outgrows memory_limit (e.g. "2GB")
+    import duckdb
+
+    spill_root = tempfile.mkdtemp(prefix="duckdb_spill_", dir=spill_dir)
+    con = duckdb.connect(config={"temp_directory": spill_root, "preserve_insertion_order": False})
+    try:
+        if threads:
+            con.execute(f"SET threads = {int(threads)}")
+        if memory_limit:
+            con.execute(f"SET memory_limit = {_literal(str(memory_limit))}")
+        columns = pq.ParquetFile(path).schema_arrow.names
+        table = con.execute(spotify_sql(columns, path)).fetch_arrow_table()
+    finally:
+        con.close()
+        shutil.rmtree(spill_root, ignore_errors=True)
+
+    template = _template(path)
+    df = table.to_pandas().astype(template.dtypes.to_dict())
+    df = df[list(template.columns)]
+    for col in ("sub_genre", "album_others"):
+        df[col] = df[col].astype(object).where(df[col].notna(), None)
+    print("Spotify shape after duckdb cleaning:", df.shape)
+    return df
+
+
+def clean_spotify_engine(path, engine="pandas", spill_dir=None, threads=None, memory_limit=None):
+    # same result from every engine; pandas reads the whole artifact into memory
+    engine = engine or "pandas"
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {', '.join(ENGINES)}")
+    if engine == "duckdb":
+        return clean_spotify_duckdb(path, spill_dir=spill_dir, threads=threads, memory_limit=memory_limit)
+    return clean_spotify(pq.read_table(path).to_pandas())
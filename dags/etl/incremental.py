@@ -0,0 +1,194 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from etl.artifacts import run_dir
+
+STATE_DIR = os.environ.get("ETL_STATE_DIR", "/opt/airflow/data/state")
+WATERMARK_FILE = "watermark.json"
+
+# spotify_snapshot: track_id/name_key/row_hash of every raw csv row seen last run
+# spotify_clean / grammy_clean: cleaned sources as of the last committed run
+# pairs: candidate (track_id, grammy_uk) pairs and their match decision
+# fact_hashes: row_hash of every row currently loaded into fact_track_metrics
+STATE_TABLES = ("spotify_snapshot", "spotify_clean", "grammy_clean", "pairs", "fact_hashes")
+
+
+def has_state():
+    names = [f"{name}.parquet" for name in STATE_TABLES] + [WATERMARK_FILE]
+    return all(os.path.exists(os.path.join(STATE_DIR, name)) for name in names)
+
+
+def resolve_mode(params=None):
+    # the first run, or an explicit full_refresh, rebuilds everything
+    if (params or {}).get("full_refresh") or not has_state():
+        return "full"
+    return "incremental"
+
+
+def read_state(name, columns=None):
+    return pq.read_table(os.path.join(STATE_DIR, f"{name}.parquet"), columns=columns).to_pandas()
+
+
+def load_watermark():
+    with open(os.path.join(STATE_DIR, WATERMARK_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def utc_watermark(values):
+    # latest of ISO timestamps with offsets as UTC "YYYY-MM-DD HH:MM:SS", the form grammy_query
+    # compares against; also turns a watermark stored with its offset by older runs into that
+    stamps = pd.to_datetime(pd.Series(values, dtype=object), utc=True)
+    return stamps.max().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def staged_state_dir(run_id=None):
+    path = os.path.join(run_dir(run_id), "state")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def stage_watermark(values, run_id=None):
+    # each source task stages its own key, commit_state merges them
+    path = os.path.join(staged_state_dir(run_id), WATERMARK_FILE)
+    current = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            current = json.load(f)
+    current.update(values)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(current, f)
+
+
+def commit_state(run_id=None):
+    # promote the state staged by this run, only once every load has succeeded
+    staged = staged_state_dir(run_id)
+    os.makedirs(STATE_DIR, exist_ok=True)
+
+    for name in STATE_TABLES:
+        src = os.path.join(staged, f"{name}.parquet")
+        if os.path.exists(src):
+            shutil.copyfile(src, os.path.join(STATE_DIR, f"{name}.parquet.tmp"))
+            os.replace(os.path.join(STATE_DIR, f"{name}.parquet.tmp"), os.path.join(STATE_DIR, f"{name}.parquet"))
+
+    watermark = {}
+    if os.path.exists(os.path.join(STATE_DIR, WATERMARK_FILE)):
+        watermark = load_watermark()
+    staged_watermark = os.path.join(staged, WATERMARK_FILE)
+    if os.path.exists(staged_watermark):
+        with open(staged_watermark, encoding="utf-8") as f:
+            watermark.update(json.load(f))
+    with open(os.path.join(STATE_DIR, WATERMARK_FILE), "w", encoding="utf-8") as f:
+        json.dump(watermark, f)
+    return watermark
+
+
+def hash_rows(df, columns=None):
+    # stable 64-bit row hash, stored as signed int64 so it fits a MySQL BIGINT
+    frame = df if columns is None else df[list(columns)]
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy().view(np.int64)
+
+
+def spotify_snapshot(raw):
+    # the name key mirrors the lower/strip applied before consolidation
+    names = pd.DataFrame({
+        "track_name": raw["track_name"].astype(str).str.lower().str.strip(),
+        "artists": raw["artists"].astype(str).str.lower().str.strip(),
+    })
+    content = raw.drop(columns=["Unnamed: 0"], errors="ignore")
+    return pd.DataFrame({
+        "track_id": raw["track_id"].astype(str).to_numpy(),
+        "name_key": hash_rows(names),
+        "row_hash": hash_rows(content),
+    })
+
+
+def affected_track_ids(old_snapshot, new_snapshot):
+    # track ids whose rows changed, closed over shared track_name + artists keys so every
+    # dedup/consolidation group touching a change is rebuilt as a whole
+    changed = set(old_snapshot["row_hash"]).symmetric_difference(new_snapshot["row_hash"])
+    both = pd.concat([old_snapshot, new_snapshot], ignore_index=True)
+    edges = both[["track_id", "name_key"]].drop_duplicates()
+
+    ids = pd.unique(both.loc[both["row_hash"].isin(changed), "track_id"])
+    while True:
+        keys = edges.loc[edges["track_id"].isin(ids), "name_key"].unique()
+        grown = edges.loc[edges["name_key"].isin(keys), "track_id"].unique()
+        if len(grown) == len(ids):
+            return pd.Series(ids, name="track_id")
+        ids = grown
+
+
+def merge_spotify(old_clean, delta_clean, affected_ids):
+    # drop every consolidated row rebuilt in this run and append the new ones
+    stale = old_clean["track_id"].isin(affected_ids)
+    current = pd.concat([old_clean[~stale], delta_clean], ignore_index=True)
+    changed = pd.unique(pd.concat([old_clean.loc[stale, "track_id"], delta_clean["track_id"]]))
+    return current, changed
+
+
+def merge_grammy(old_clean, delta_clean, source_uks=None):
+    # grammy rows have no id, the natural key hash (grammy_uk) identifies them. An update that
+    # changes a key column looks like a new row, so state rows whose key is no longer in the
+    # source (source_uks, from the key projection) are dropped along with deleted rows
+    if source_uks is not None:
+        old_clean = old_clean[old_clean["grammy_uk"].isin(source_uks)]
+    current = pd.concat([old_clean[~old_clean["grammy_uk"].isin(delta_clean["grammy_uk"])], delta_clean],
+                        ignore_index=True)
+    return current.drop_duplicates(subset="grammy_uk", keep="last").reset_index(drop=True)
+
+
+def fact_row_hashes(merged):
+    # identical rows get distinct hashes through their occurrence number
+    hashes = pd.Series(hash_rows(merged))
+    occurrence = hashes.groupby(hashes).cumcount()
+    return hash_rows(pd.DataFrame({"row_hash": hashes, "occurrence": occurrence}))
+
+
+def _keyed_pairs(pairs, sp, gr):
+    return pd.DataFrame({
+        "track_id": sp["track_id"].to_numpy()[pairs["sp_row"]],
+        "grammy_uk": gr["grammy_uk"].to_numpy()[pairs["gr_row"]],
+        "title_score": pairs["title_score"].to_numpy(),
+        "grammy_nominee": pairs["grammy_nominee"].to_numpy(),
+    })
+
+
+def update_pairs(old_pairs, sp, gr, new_track_ids, new_grammy_uks, matcher):
+    # keep old decisions between unchanged rows, match changed rows against the other full side
+    keep = old_pairs[~old_pairs["track_id"].isin(new_track_ids)
+                     & ~old_pairs["grammy_uk"].isin(new_grammy_uks)
+                     & old_pairs["track_id"].isin(sp["track_id"])
+                     & old_pairs["grammy_uk"].isin(gr["grammy_uk"])]
+
+    sp_new = sp["track_id"].isin(new_track_ids).to_numpy()
+    gr_new = gr["grammy_uk"].isin(new_grammy_uks).to_numpy()
+    sp_changed, sp_same = sp[sp_new].reset_index(drop=True), sp[~sp_new].reset_index(drop=True)
+    gr_changed = gr[gr_new].reset_index(drop=True)
+
+    found = [keep]
+    if len(sp_changed):
+        found.append(_keyed_pairs(matcher(sp_changed, gr), sp_changed, gr))
+    if len(gr_changed) and len(sp_same):
+        found.append(_keyed_pairs(matcher(sp_same, gr_changed), sp_same, gr_changed))
+    return pd.concat(found, ignore_index=True)
+
+
+def full_pairs(sp, gr, matcher):
+    return _keyed_pairs(matcher(sp, gr), sp, gr)
+
+
+def pair_positions(pairs, sp, gr):
+    # keyed pairs back to the row positions join_matches expects
+    sp_pos = pd.Series(np.arange(len(sp)), index=sp["track_id"].to_numpy())
+    gr_pos = pd.Series(np.arange(len(gr)), index=gr["grammy_uk"].to_numpy())
+    return pd.DataFrame({
+        "sp_row": sp_pos.reindex(pairs["track_id"].to_numpy()).to_numpy(),
+        "gr_row": gr_pos.reindex(pairs["grammy_uk"].to_numpy()).to_numpy(),
+        "title_score": pairs["title_score"].to_numpy(),
+        "grammy_nominee": pairs["grammy_nominee"].to_numpy(),
+    })
@@ -0,0 +1,370 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+from collections import Counter, defaultdict
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+
+from etl.incremental import hash_rows
+from etl.normalize import CACHE_DIR
+
+TITLE_THRESHOLD = 90
+ARTIST_THRESHOLD = 90
+
+MATCH_CACHE_PATH = os.path.join(CACHE_DIR, "matches.sqlite")
+MATCH_CACHE_SIZE = 2_000_000
+
+# bump when scoring or the decision rules change so old cache rows are ignored
+MATCHER_VERSION = 2
+
+# cdist batch size on the spotify side of a block, keeps the score matrix small
+BATCH_SIZE = 2048
+
+TOKEN_RE = re.compile(r"\w+")
+
+# character n-grams of the second blocking key, catch typos inside the 4-char token prefixes
+GRAM_SIZE = 3
+
+# too common to be useful as blocking keys, unless the title has nothing else
+STOPWORDS = frozenset({
+    "a", "an", "the", "of", "and", "in", "on", "to", "for", "my", "me", "you",
+    "i", "is", "it", "your", "de", "la", "el", "en", "y", "feat", "remix",
+    "version", "remastered", "live", "edit", "mix",
+})
+
+
+def blocking_keys(title):
+    # 4-char token prefixes, so "colour" and "color" still land in the same block
+    tokens = TOKEN_RE.findall(title)
+    keys = {t[:4] for t in tokens if t not in STOPWORDS}
+    if not keys:
+        keys = {t[:4] for t in tokens} or {title}
+    return keys
+
+
+def _gram_text(title):
+    # the string token_set_ratio compares when two titles have no token in common
+    return " ".join(sorted(set(title.split())))
+
+
+def _grams(text):
+    return {text[i:i + GRAM_SIZE] for i in range(max(1, len(text) - GRAM_SIZE + 1))}
+
+
+def gram_keys(texts, threshold):
+    # prefix filter on character grams: a ratio >= threshold bounds the indel distance d
+    # between the two strings, each edit breaks at most GRAM_SIZE grams, so the two share all
+    # but GRAM_SIZE * d of their grams. In one global order (rarest first) both texts then
+    # share one of their first GRAM_SIZE * d + 1 grams, and only those are keys. Below a
+    # threshold of about 88 short strings can match without any common gram at all.
+    grams = [_grams(text) for text in texts]
+    freq = Counter(chain.from_iterable(grams))
+    rank = {g: i for i, g in enumerate(sorted(freq, key=lambda g: (freq[g], g)))}
+    # the other string is at most n * (200 - threshold) / threshold long
+    reach = (100 - threshold) / 100 * (1 + (200 - threshold) / threshold)
+    keys = []
+    for text, text_grams in zip(texts, grams):
+        edits = int(reach * len(text) + 1e-9)
+        keys.append(sorted(text_grams, key=rank.__getitem__)[:GRAM_SIZE * edits + 1])
+    return keys
+
+
+def _index(key_sets):
+    index = defaultdict(list)
+    for i, keys in enumerate(key_sets):
+        for key in keys:
+            index[key].append(i)
+    return {key: np.asarray(ids, dtype=np.int64) for key, ids in index.items()}
+
+
+def build_block_index(titles):
+    return _index(blocking_keys(title) for title in titles)
+
+
+def _block_pairs(sp_index, gr_index, sp_values, gr_values, scorer, threshold):
+    # (sp, gr) positions scoring >= threshold within the blocks both sides share
+    found = []
+    for key, gr_ids in gr_index.items():
+        sp_ids = sp_index.get(key)
+        if sp_ids is None:
+            continue
+        for start in range(0, len(sp_ids), BATCH_SIZE):
+            batch = sp_ids[start:start + BATCH_SIZE]
+            scores = process.cdist(
+                sp_values[batch], gr_values[gr_ids],
+                scorer=scorer, score_cutoff=threshold,
+                dtype=np.uint8, workers=-1,
+            )
+            rows, cols = np.nonzero(scores)
+            found.append(np.column_stack([batch[rows], gr_ids[cols]]))
+    return found
+
+
+def candidate_title_pairs(sp_titles, gr_titles, threshold=TITLE_THRESHOLD):
+    # scores only titles that share a block, returns unique (sp, gr) title positions >= threshold.
+    # titles sharing a word meet in a token block; titles sharing none are compared by
+    # token_set_ratio as their sorted token strings, so the gram blocks use the cheaper plain
+    # ratio on those strings and only rescore the pairs that pass it
+    sp_titles = np.asarray(sp_titles, dtype=object)
+    gr_titles = np.asarray(gr_titles, dtype=object)
+    found = _block_pairs(build_block_index(sp_titles), build_block_index(gr_titles),
+                         sp_titles, gr_titles, fuzz.token_set_ratio, threshold)
+
+    sp_texts = np.asarray([_gram_text(title) for title in sp_titles], dtype=object)
+    gr_texts = np.asarray([_gram_text(title) for title in gr_titles], dtype=object)
+    keys = gram_keys(np.concatenate([sp_texts, gr_texts]), threshold)
+    typos = _block_pairs(_index(keys[:len(sp_texts)]), _index(keys[len(sp_texts):]),
+                         sp_texts, gr_texts, fuzz.ratio, threshold)
+    if typos:
+        typos = np.unique(np.concatenate(typos), axis=0)
+        scores = process.cpdist(sp_titles[typos[:, 0]], gr_titles[typos[:, 1]], scorer=fuzz.token_set_ratio,
+                                score_cutoff=threshold, dtype=np.uint8, workers=-1)
+        found.append(typos[scores > 0])
+
+    if not found:
+        return np.empty((0, 2), dtype=np.int64)
+    return np.unique(np.concatenate(found), axis=0)
+
+
+def _pairwise_scores(left, right):
+    if len(left) == 0:
+        return np.empty(0, dtype=np.float64)
+    return process.cpdist(list(left), list(right), scorer=fuzz.token_set_ratio, workers=-1)
+
+
+def _artist_matches(pairs, sp_artists, gr_artists, threshold):
+    # a pair matches when any spotify artist scores >= threshold against any grammy artist
+    sp_long = (pd.Series(sp_artists.to_numpy(), name="a_sp").explode().dropna()
+               .rename_axis("sp_row").reset_index())
+    gr_long = (pd.Series(gr_artists.to_numpy(), name="a_gr").explode().dropna()
+               .rename_axis("gr_row").reset_index())
+
+    cross = (pairs[["pair", "sp_row", "gr_row"]]
+             .merge(sp_long, on="sp_row")
+             .merge(gr_long, on="gr_row"))
+    unique = cross[["a_sp", "a_gr"]].drop_duplicates()
+    unique["score"] = _pairwise_scores(unique["a_sp"], unique["a_gr"])
+
+    cross = cross.merge(unique, on=["a_sp", "a_gr"])
+    matched = cross.loc[cross["score"] >= threshold, "pair"].unique()
+    return pairs["pair"].isin(matched)
+
+
+class MatchCache:
+    # sqlite store of title candidates and pair decisions shared by daily runs and match
+    # shards; rows unused for the longest time are evicted above maxsize per table
+
+    TABLES = {
+        "candidates": {"gr_titles": "TEXT"},
+        "decisions": {"title_score": "REAL", "grammy_nominee": "INTEGER"},
+    }
+
+    def __init__(self, path=MATCH_CACHE_PATH, maxsize=MATCH_CACHE_SIZE):
+        self.path = path
+        self.maxsize = maxsize
+        self.conn = None
+        self.stats = {table: {"hits": 0, "misses": 0} for table in self.TABLES}
+
+    def open(self):
+        if self.path:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # parallel shards share the file, wal lets them read while another one writes
+        self.conn = sqlite3.connect(self.path or ":memory:", timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        for table, columns in self.TABLES.items():
+            columns = ", ".join(f"{name} {kind}" for name, kind in columns.items())
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS {table} "
+                              f"(key INTEGER PRIMARY KEY, {columns}, used REAL)")
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_used ON {table} (used)")
+        self.conn.commit()
+        return self
+
+    def close(self):
+        if self.conn is None:
+            return
+        self.evict()
+        self.conn.close()
+        self.conn = None
+
+    def get(self, table, keys):
+        # cached rows for the keys, indexed by key; hits are marked as used
+        keys = pd.unique(np.asarray(keys, dtype=np.int64))
+        columns = ", ".join(self.TABLES[table])
+        with self.conn:
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS lookup (key INTEGER PRIMARY KEY)")
+            self.conn.execute("DELETE FROM lookup")
+            self.conn.executemany("INSERT INTO lookup VALUES (?)", ((int(k),) for k in keys))
+            found = pd.read_sql_query(f"SELECT t.key, {columns} FROM {table} t JOIN lookup USING (key)",
+                                      self.conn)
+            # not index_col/set_index: pandas may mistake two keys for a range and lose the index
+            found.index = pd.Index(found.pop("key").to_numpy(dtype=np.int64), name="key")
+            self.conn.execute(f"UPDATE {table} SET used = ? WHERE key IN (SELECT key FROM lookup)", (time.time(),))
+        self.stats[table]["hits"] += len(found)
+        self.stats[table]["misses"] += len(keys) - len(found)
+        return found
+
+    def put(self, table, keys, *values):
+        now = time.time()
+        rows = zip((int(k) for k in keys), *values)
+        marks = ", ".join("?" * (len(values) + 2))
+        with self.conn:
+            self.conn.executemany(f"INSERT OR REPLACE INTO {table} VALUES ({marks})",
+                                  (row + (now,) for row in rows))
+
+    def evict(self):
+        with self.conn:
+            for table in self.TABLES:
+                extra = self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] - self.maxsize
+                if extra > 0:
+                    self.conn.execute(f"DELETE FROM {table} WHERE key IN "
+                                      f"(SELECT key FROM {table} ORDER BY used LIMIT ?)", (extra,))
+
+    def hit_rate(self, table):
+        stats = self.stats[table]
+        total = stats["hits"] + stats["misses"]
+        return round(stats["hits"] / total, 3) if total else None
+
+    def report(self):
+        return {table: {**stats, "hit_rate": self.hit_rate(table)} for table, stats in self.stats.items()}
+
+
+def _cached_candidates(sp_titles, gr_titles, title_thr, cache):
+    # candidates of a spotify title only depend on that title and the whole grammy title set
+    if cache is None:
+        return candidate_title_pairs(sp_titles, gr_titles, threshold=title_thr)
+
+    digest = hashlib.sha1("\n".join(sorted(gr_titles)).encode("utf-8")).hexdigest()
+    keys = hash_rows(pd.DataFrame({"title": sp_titles, "grammy": digest,
+                                   "threshold": title_thr, "version": MATCHER_VERSION}))
+    found = cache.get("candidates", keys)
+    cached = pd.Series(keys).isin(found.index).to_numpy()
+    todo = np.flatnonzero(~cached)
+
+    fresh = candidate_title_pairs([sp_titles[i] for i in todo], gr_titles, threshold=title_thr)
+    fresh[:, 0] = todo[fresh[:, 0]]
+    by_title = defaultdict(list)
+    for sp, gr in fresh:
+        by_title[sp].append(gr_titles[gr])
+    cache.put("candidates", keys[todo], [json.dumps(by_title[i]) if i in by_title else "[]" for i in todo])
+
+    # most titles have no candidates, only the others need decoding
+    gr_pos = {title: i for i, title in enumerate(gr_titles)}
+    lists = pd.Series(found["gr_titles"].reindex(keys).to_numpy())
+    lists = lists[cached & (lists != "[]").to_numpy()]
+    hits = [(i, gr_pos[title]) for i, value in lists.items() for title in json.loads(value) if title in gr_pos]
+    hits = np.asarray(hits, dtype=np.int64).reshape(-1, 2)
+    return np.unique(np.concatenate([fresh, hits]), axis=0)
+
+
+def _decide(pairs, sp_titles, gr_titles, sp_artists, gr_artists, various, title_thr, artist_thr):
+    # title score and grammy_nominee for (sp_title, gr_title, sp_row, gr_row) pairs
+    pairs = pairs[["sp_title", "gr_title", "sp_row", "gr_row"]].reset_index(drop=True)
+    titles = pairs[["sp_title", "gr_title"]].drop_duplicates()
+    titles["title_score"] = _pairwise_scores(sp_titles[titles["sp_title"]], gr_titles[titles["gr_title"]])
+    pairs = pairs.merge(titles, on=["sp_title", "gr_title"], how="left")
+    pairs["pair"] = np.arange(len(pairs))
+
+    title_ok = pairs["title_score"] >= title_thr
+
+    # various artists: only require a spotify collaboration
+    pair_various = various[pairs["gr_row"]]
+    n_sp_artists = sp_artists.map(lambda a: len(a) if isinstance(a, (list, np.ndarray)) else 0).to_numpy()
+    various_ok = n_sp_artists[pairs["sp_row"]] > 1
+
+    regular = pairs[title_ok.to_numpy() & ~pair_various]
+    artist_ok = pd.Series(False, index=pairs.index)
+    artist_ok[regular.index] = _artist_matches(regular, sp_artists, gr_artists, artist_thr).to_numpy()
+
+    pairs["grammy_nominee"] = title_ok & np.where(pair_various, various_ok, artist_ok)
+    return pairs
+
+
+def _artist_keys(artists):
+    return artists.map(lambda a: ";".join(a) if isinstance(a, (list, np.ndarray)) else "").to_numpy(dtype=object)
+
+
+def match_pairs(df, df1, title_thr=TITLE_THRESHOLD, artist_thr=ARTIST_THRESHOLD, cache=None):
+    # candidate (spotify row, grammy row) pairs: every exact title pair, plus the fuzzy
+    # title pairs that also pass the artist rule. grammy_nominee holds the decision.
+    # with a MatchCache, only title/artist combinations it has not seen are scored.
+    sp_valid = df["track_name"].map(lambda t: isinstance(t, str))
+    gr_valid = df1["nominee"].map(lambda t: isinstance(t, str))
+
+    sp_codes, sp_titles = pd.factorize(df["track_name"].where(sp_valid))
+    gr_codes, gr_titles = pd.factorize(df1["nominee"].where(gr_valid))
+
+    fuzzy = _cached_candidates(list(sp_titles), list(gr_titles), title_thr, cache)
+    fuzzy = pd.DataFrame(fuzzy, columns=["sp_title", "gr_title"])
+
+    # exact pairs are always kept, as the plain merge on track_name == nominee did
+    exact = pd.merge(
+        pd.DataFrame({"sp_title": np.arange(len(sp_titles)), "title": sp_titles}),
+        pd.DataFrame({"gr_title": np.arange(len(gr_titles)), "title": gr_titles}),
+        on="title",
+    )[["sp_title", "gr_title"]]
+    exact["exact"] = True
+
+    titles = fuzzy.merge(exact, on=["sp_title", "gr_title"], how="outer")
+    titles["exact"] = titles["exact"].fillna(False).astype(bool)
+
+    sp_rows = pd.DataFrame({"sp_title": sp_codes, "sp_row": np.arange(len(df))})
+    gr_rows = pd.DataFrame({"gr_title": gr_codes, "gr_row": np.arange(len(df1))})
+    pairs = titles.merge(sp_rows, on="sp_title").merge(gr_rows, on="gr_title").reset_index(drop=True)
+
+    sp_artists = df["artist_list_spotify"].reset_index(drop=True)
+    gr_artists = df1["artist_list_grammy"].reset_index(drop=True)
+    various = df1["is_various_artists"].to_numpy(dtype=bool)
+
+    todo = np.ones(len(pairs), dtype=bool)
+    pairs["title_score"] = np.nan
+    pairs["grammy_nominee"] = False
+    if cache is not None:
+        # the decision only depends on both titles, both artist lists and the various flag
+        keys = hash_rows(pd.DataFrame({
+            "sp_title": sp_titles.to_numpy(dtype=object)[pairs["sp_title"]],
+            "gr_title": gr_titles.to_numpy(dtype=object)[pairs["gr_title"]],
+            "sp_artists": _artist_keys(sp_artists)[pairs["sp_row"]],
+            "gr_artists": _artist_keys(gr_artists)[pairs["gr_row"]],
+            "various": various[pairs["gr_row"]],
+            "title_thr": title_thr, "artist_thr": artist_thr, "version": MATCHER_VERSION,
+        }))
+        found = cache.get("decisions", keys)
+        todo = ~pd.Series(keys).isin(found.index).to_numpy()
+        hits = found.reindex(keys[~todo])
+        pairs.loc[~todo, "title_score"] = hits["title_score"].astype(float).to_numpy()
+        pairs.loc[~todo, "grammy_nominee"] = hits["grammy_nominee"].astype(bool).to_numpy()
+
+    scored = _decide(pairs[todo], sp_titles, gr_titles, sp_artists, gr_artists, various, title_thr, artist_thr)
+    pairs.loc[todo, "title_score"] = scored["title_score"].to_numpy()
+    pairs.loc[todo, "grammy_nominee"] = scored["grammy_nominee"].to_numpy()
+    if cache is not None:
+        cache.put("decisions", keys[todo], scored["title_score"].astype(float),
+                  scored["grammy_nominee"].astype(int))
+
+    pairs = pairs[pairs["exact"] | pairs["grammy_nominee"]]
+    return pairs[["sp_row", "gr_row", "title_score", "grammy_nominee"]].reset_index(drop=True)
+
+
+def join_matches(df, df1, pairs, suffixes=("_spotify", "_grammy")):
+    # outer-style frame: one row per pair, plus unpaired rows from either side
+    overlap = set(df.columns) & set(df1.columns)
+    left = df.rename(columns={c: c + suffixes[0] for c in overlap})
+    right = df1.rename(columns={c: c + suffixes[1] for c in overlap})
+    left = left.reset_index(drop=True).rename_axis("sp_row").reset_index()
+    right = right.reset_index(drop=True).rename_axis("gr_row").reset_index()
+
+    paired = (pairs[["sp_row", "gr_row", "grammy_nominee"]]
+              .merge(left, on="sp_row")
+              .merge(right, on="gr_row"))
+    only_sp = left[~left["sp_row"].isin(pairs["sp_row"])]
+    only_gr = right[~right["gr_row"].isin(pairs["gr_row"])]
+
+    merged = pd.concat([paired, only_sp, only_gr], ignore_index=True, sort=False)
+    merged["grammy_nominee"] = merged["grammy_nominee"].fillna(False).astype(bool)
+    return merged.drop(columns=["sp_row", "gr_row"])
@@ -0,0 +1,159 @@
+import cProfile
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+
+from etl.artifacts import run_dir
+
+
+def rss_mb():
+    # current resident set size; /proc on linux, peak-so-far elsewhere
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except OSError:
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1024 ** 2
+
+
+class RssSampler:
+    # peak RSS during a block, sampled from a background thread
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0.0
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, rss_mb())
+
+    def __enter__(self):
+        self.peak = rss_mb()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_mb())
+
+
+def _rows(value):
+    # row count of a frame, or of every frame in a tuple
+    if isinstance(value, tuple):
+        counts = [_rows(v) for v in value]
+        return sum(c for c in counts if c is not None) if any(c is not None for c in counts) else None
+    if hasattr(value, "shape") and len(value.shape):
+        return int(value.shape[0])
+    return None
+
+
+class StageMetrics:
+    # wall time, cpu time, peak RSS and row counts for each named sub-stage of a task
+
+    def __init__(self, task, ti=None, profile_stage=None, profile_dir=None):
+        self.task = task
+        self.ti = ti
+        self.profile_stage = profile_stage
+        self.profile_dir = profile_dir
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        # set record["rows_out"] inside the block to report the output size
+        record = {"rows_in": rows_in, "rows_out": None}
+        profiler = self._start_profile(name)
+        wall, cpu = time.perf_counter(), time.process_time()
+        sampler = RssSampler()
+        try:
+            with sampler:
+                yield record
+        finally:
+            record["wall_s"] = round(time.perf_counter() - wall, 3)
+            record["cpu_s"] = round(time.process_time() - cpu, 3)
+            record["peak_mb"] = round(sampler.peak, 1)
+            self._stop_profile(name, profiler)
+            self.stages[name] = record
+            print(f"[stage] {self.task}.{name}: {record['wall_s']}s wall, {record['cpu_s']}s cpu, "
+                  f"{record['peak_mb']} MB peak, rows {record['rows_in']} -> {record['rows_out']}")
+            # pushed after every stage so a failing task still reports what it got through
+            if self.ti is not None:
+                self.ti.xcom_push(key="metrics", value=self.summary())
+
+    def timed(self, name=None):
+        # decorator form, rows from the first argument and the result
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(name or func.__name__, rows_in=_rows(args[0]) if args else None) as record:
+                    result = func(*args, **kwargs)
+                    record["rows_out"] = _rows(result)
+                return result
+            return wrapper
+        return decorator
+
+    def summary(self):
+        # compact enough for xcom
+        return {"task": self.task, "stages": self.stages}
+
+    def _start_profile(self, name):
+        if not self.profile_stage or self.profile_stage not in (name, f"{self.task}.{name}"):
+            return None
+        tracemalloc.start()
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def _stop_profile(self, name, profiler):
+        if profiler is None:
+            return
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        os.makedirs(self.profile_dir, exist_ok=True)
+        base = os.path.join(self.profile_dir, f"{self.task}.{name}")
+        profiler.dump_stats(base + ".prof")
+        with open(base + ".tracemalloc.txt", "w", encoding="utf-8") as f:
+            for stat in snapshot.statistics("lineno")[:50]:
+                f.write(f"{stat}\n")
+        print(f"Profile of {self.task}.{name} written to {base}.prof and {base}.tracemalloc.txt")
+
+
+def task_metrics(task, ti=None, params=None, run_id=None):
+    # profile_stage param: "matching" or "match_shard.0.matching" dumps cProfile and
+    # tracemalloc snapshots for that one stage into the run's staging folder
+    profile_stage = (params or {}).get("profile_stage") or None
+    profile_dir = os.path.join(run_dir(run_id), "profiles") if profile_stage else None
+    return StageMetrics(task, ti=ti, profile_stage=profile_stage, profile_dir=profile_dir)
+
+
+def write_run_report(summaries, path, run_id=None):
+    # one json per run with every task's stages and their totals
+    tasks = {}
+    for summary in summaries:
+        if not summary:
+            continue
+        stages = summary["stages"]
+        tasks[summary["task"]] = {
+            "wall_s": round(sum(s["wall_s"] for s in stages.values()), 3),
+            "cpu_s": round(sum(s["cpu_s"] for s in stages.values()), 3),
+            "peak_mb": max((s["peak_mb"] for s in stages.values()), default=None),
+            "stages": stages,
+        }
+    report = {"run_id": run_id, "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "tasks": tasks}
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp_path, path)
+    return report
@@ -0,0 +1,108 @@
+import json
+import os
+import re
+import unicodedata
+from collections import OrderedDict
+
+import pandas as pd
+
+CACHE_DIR = os.environ.get("ETL_CACHE_DIR", "/opt/airflow/data/cache")
+ARTIST_CACHE_PATH = os.path.join(CACHE_DIR, "artists.json")
+ARTIST_CACHE_SIZE = 200_000
+
+# bump when the rules below change so old cache files are ignored
+NORMALIZER_VERSION = 1
+
+CONNECTOR_RE = re.compile(r"\s*(feat\.?|featuring|with|and|,|&|;)\s*")
+SPACES_RE = re.compile(r"\s+")
+VARIOUS_RE = re.compile(r"\b(various|varios)\s+artists?\b")
+VARIOUS_ALIASES = frozenset({
+    "various artists", "varios artistas", "v.a.", "v.a", "varios", "various",
+    "artistas varios", "compilation", "compilacion",
+})
+
+
+def _ascii_lower(artist_str):
+    return unicodedata.normalize("NFKD", artist_str).encode("ascii", "ignore").decode("utf-8").lower()
+
+
+def normalize_artists(artist_str):
+    if pd.isna(artist_str) or str(artist_str).strip() == "":
+        return []
+    s = CONNECTOR_RE.sub(";", _ascii_lower(str(artist_str)))
+    return [a.strip() for a in s.split(";") if a.strip()]
+
+
+def is_various_artists(artist_str):
+    if pd.isna(artist_str) or str(artist_str).strip() == "":
+        return False
+    s = SPACES_RE.sub(" ", _ascii_lower(str(artist_str)).strip())
+    return s in VARIOUS_ALIASES or bool(VARIOUS_RE.search(s))
+
+
+class ArtistCache:
+    # LRU of raw artist string -> (artist list, various flag), persisted as json between runs
+
+    def __init__(self, path=ARTIST_CACHE_PATH, maxsize=ARTIST_CACHE_SIZE):
+        self.path = path
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return self
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                payload = json.load(f)
+        except (OSError, ValueError):
+            # a broken cache only costs a cold run
+            return self
+        if payload.get("version") == NORMALIZER_VERSION:
+            for raw, artists, various in payload.get("entries", []):
+                self.entries[raw] = (artists, various)
+        return self
+
+    def save(self):
+        if not self.path:
+            return
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "version": NORMALIZER_VERSION,
+                "entries": [[raw, artists, various] for raw, (artists, various) in self.entries.items()],
+            }, f)
+        os.replace(tmp_path, self.path)
+
+    def get(self, raw):
+        entry = self.entries.get(raw)
+        if entry is None:
+            self.misses += 1
+            entry = (normalize_artists(raw), is_various_artists(raw))
+            self.entries[raw] = entry
+        else:
+            self.hits += 1
+            self.entries.move_to_end(raw)
+        return entry
+
+
+def normalize_artist_column(values, cache=None):
+    # normalizes each distinct value once and maps the results back onto the rows
+    cache = cache if cache is not None else ArtistCache(path=None)
+    values = pd.Series(values)
+    codes, uniques = pd.factorize(values)
+
+    entries = [cache.get(raw) for raw in uniques]
+    artist_lists = pd.Series([e[0] for e in entries] + [[]], dtype=object)
+    various = pd.Series([e[1] for e in entries] + [False], dtype=bool)
+
+    # code -1 (missing value) picks the trailing empty entry
+    codes = pd.Series(codes).where(codes >= 0, len(uniques)).to_numpy()
+    return (
+        pd.Series(artist_lists.to_numpy()[codes], index=values.index, dtype=object),
+        pd.Series(various.to_numpy()[codes], index=values.index, dtype=bool),
+    )
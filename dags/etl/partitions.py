@@ -0,0 +1,156 @@
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from etl.bulk import write_table
+
+# fact_track_metrics is RANGE partitioned on its year column: p_none holds the rows without
+# a grammy year (0), p1958 everything up to the first ceremony, then one partition per year
+# and p_future as catch-all. A reload only rewrites the partitions whose rows changed.
+
+FACT_TABLE = "fact_track_metrics"
+FIRST_YEAR = 1958
+
+
+def _qualified(table, schema=None):
+    return f"{schema}.{table}" if schema else table
+
+
+def partition_label(years):
+    # partition of each year as a number: 0 for p_none, otherwise the partition's year
+    years = pd.Series(years).fillna(0).astype(int).to_numpy()
+    return pd.Series(np.where(years < 1, 0, np.maximum(years, FIRST_YEAR)))
+
+
+def partition_name(label):
+    return "p_none" if label == 0 else f"p{label}"
+
+
+def partition_clause(last_year=None):
+    # PARTITION BY clause for the fact DDL, one partition per year up to last_year
+    last_year = last_year or time.localtime().tm_year
+    parts = ["PARTITION p_none VALUES LESS THAN (1)"]
+    parts += [f"PARTITION p{year} VALUES LESS THAN ({year + 1})" for year in range(FIRST_YEAR, last_year + 1)]
+    parts.append("PARTITION p_future VALUES LESS THAN MAXVALUE")
+    return "PARTITION BY RANGE (year) (\n            " + ",\n            ".join(parts) + "\n        )"
+
+
+def _is_mysql(engine):
+    return engine.dialect.name == "mysql"
+
+
+def existing_partitions(engine, schema=None):
+    # partition names of the fact table, empty when it is not partitioned (or not on mysql)
+    if not _is_mysql(engine):
+        return []
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT partition_name FROM information_schema.partitions "
+            "WHERE table_schema = COALESCE(:schema, DATABASE()) AND table_name = :table "
+            "AND partition_name IS NOT NULL ORDER BY partition_ordinal_position"
+        ), {"schema": schema, "table": FACT_TABLE}).fetchall()
+    return [row[0] for row in rows]
+
+
+def extend_partitions(engine, max_year, schema=None):
+    # years past the last yearly partition would all land in p_future, split it first
+    names = existing_partitions(engine, schema)
+    years = [int(name[1:]) for name in names if name[1:].isdigit()]
+    if not years or max_year <= max(years):
+        return []
+    new = list(range(max(years) + 1, max_year + 1))
+    parts = [f"PARTITION p{year} VALUES LESS THAN ({year + 1})" for year in new]
+    parts.append("PARTITION p_future VALUES LESS THAN MAXVALUE")
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {_qualified(FACT_TABLE, schema)} "
+                          f"REORGANIZE PARTITION p_future INTO ({', '.join(parts)})"))
+    print(f"Added fact partitions for {new[0]}..{new[-1]}")
+    return new
+
+
+def _digests(labels, hashes):
+    # row count and xor of the row hashes per partition, cheap to compare
+    frame = pd.DataFrame({"label": np.asarray(labels, dtype=np.int64),
+                          "row_hash": np.asarray(hashes, dtype=np.int64).view(np.uint64)})
+    return frame.groupby("label")["row_hash"].agg(rows="size", digest=np.bitwise_xor.reduce)
+
+
+def warehouse_digests(engine, schema=None):
+    table = _qualified(FACT_TABLE, schema)
+    with engine.connect() as conn:
+        if _is_mysql(engine):
+            # BIT_XOR per year over the row_hash index, combined per partition below
+            found = pd.DataFrame(conn.execute(text(
+                f"SELECT year, COUNT(*), BIT_XOR(row_hash) FROM {table} GROUP BY year")).fetchall(),
+                columns=["year", "rows", "digest"])
+            found["label"] = partition_label(found["year"]).to_numpy()
+            found["digest"] = found["digest"].astype(np.uint64)
+            return found.groupby("label").agg(rows=("rows", "sum"), digest=("digest", np.bitwise_xor.reduce))
+        found = pd.DataFrame(conn.execute(text(f"SELECT year, row_hash FROM {table}")).fetchall(),
+                             columns=["year", "row_hash"])
+    return _digests(partition_label(found["year"]), found["row_hash"])
+
+
+def changed_partitions(fact, old):
+    # labels whose rows differ from what the warehouse holds, including emptied ones
+    new = _digests(partition_label(fact["year"]), fact["row_hash"])
+    both = new.join(old, how="outer", lsuffix="_new", rsuffix="_old")
+    differs = ((both["rows_new"] != both["rows_old"]) | (both["digest_new"] != both["digest_old"]))
+    return sorted(int(label) for label in both.index[differs])
+
+
+def _label_filter(label):
+    # the year range one partition label covers
+    if label == 0:
+        return "year < 1"
+    if label == FIRST_YEAR:
+        return f"year >= 1 AND year <= {FIRST_YEAR}"
+    return f"year = {int(label)}"
+
+
+def reload_partitions(engine, fact, labels, schema=None, method="auto", workers=1):
+    # mysql: each partition is loaded into a plain copy of the table and swapped in with
+    # EXCHANGE PARTITION, so readers see the old rows until the swap; emptied partitions are
+    # truncated. Elsewhere the same per-partition delete + insert is done with plain SQL.
+    table = _qualified(FACT_TABLE, schema)
+    swap = f"{FACT_TABLE}_swap"
+    fact_labels = partition_label(fact["year"]).to_numpy()
+    stats = []
+    for label in labels:
+        rows = fact[fact_labels == label]
+        name = partition_name(label)
+        if not _is_mysql(engine):
+            with engine.begin() as conn:
+                conn.execute(text(f"DELETE FROM {table} WHERE {_label_filter(label)}"))
+            stats.append(write_table(engine, rows, FACT_TABLE, schema=schema, method=method))
+            continue
+
+        if not len(rows):
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table} TRUNCATE PARTITION {name}"))
+            print(f"{FACT_TABLE}: truncated partition {name}")
+            continue
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {_qualified(swap, schema)}"))
+            conn.execute(text(f"CREATE TABLE {_qualified(swap, schema)} LIKE {table}"))
+            conn.execute(text(f"ALTER TABLE {_qualified(swap, schema)} REMOVE PARTITIONING"))
+            # a fresh table counts fact_id from 1 again, the swapped-in rows would reuse ids
+            # the other partitions hold; MAX over the primary key, the AUTO_INCREMENT column
+            # in information_schema can be a cached value
+            next_id = conn.execute(text(f"SELECT COALESCE(MAX(fact_id), 0) + 1 FROM {table}")).scalar()
+            conn.execute(text(f"ALTER TABLE {_qualified(swap, schema)} AUTO_INCREMENT = {int(next_id)}"))
+        try:
+            stats.append(write_table(engine, rows, swap, schema=schema, method=method, relax_checks=True,
+                                     workers=workers))
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table} EXCHANGE PARTITION {name} WITH TABLE {_qualified(swap, schema)}"))
+                # and the fact table counts on past the ids it just received
+                next_id = conn.execute(text(f"SELECT COALESCE(MAX(fact_id), 0) + 1 FROM {table}")).scalar()
+                conn.execute(text(f"ALTER TABLE {table} AUTO_INCREMENT = {int(next_id)}"))
+        finally:
+            with engine.begin() as conn:
+                conn.execute(text(f"DROP TABLE IF EXISTS {_qualified(swap, schema)}"))
+        print(f"{FACT_TABLE}: exchanged partition {name} ({len(rows)} rows)")
+    return stats
@@ -0,0 +1,50 @@
+# 0-1 audio features, float32 keeps ~7 significant digits which is more than the source has
+AUDIO_FEATURES = ["danceability", "energy", "speechiness", "acousticness",
+                  "instrumentalness", "liveness", "valence"]
+
+# raw spotify csv; nullable ints because nulls are only dropped during cleaning
+SPOTIFY_DTYPES = {
+    "track_id": str, "artists": str, "album_name": str, "track_name": str, "track_genre": str,
+    "popularity": "Int16", "duration_ms": "Int32", "explicit": "boolean",
+    "key": "Int8", "mode": "Int8", "time_signature": "Int8",
+    "loudness": "float32", "tempo": "float32",
+    **{col: "float32" for col in AUDIO_FEATURES},
+}
+
+# spotify after null drop, every column is filled
+SPOTIFY_CLEAN_DTYPES = {
+    "popularity": "int16", "duration_ms": "int32",
+    "loudness": "float32", "tempo": "float32",
+    **{col: "float32" for col in AUDIO_FEATURES},
+}
+
+GRAMMY_DTYPES = {
+    "year": "Int16", "title": "category", "category": "category", "winner": "boolean",
+}
+
+# grammy extract batches; category codes would differ from batch to batch in the staging
+# file, so text stays plain until the whole table is read back
+GRAMMY_BATCH_DTYPES = {col: dtype for col, dtype in GRAMMY_DTYPES.items() if dtype != "category"}
+
+# merged dataset, shared by the transform output and load_star_schema; nulls are filled
+# by then, so booleans stay plain bool
+MERGED_DTYPES = {
+    "popularity": "int16", "duration_min": "float32",
+    "loudness": "float32", "tempo": "float32",
+    **{col: "float32" for col in AUDIO_FEATURES},
+    "main_genre": "category", "sub_genre": "category",
+    "year": "int16", "title": "category", "category": "category",
+}
+
+
+def apply_schema(df, dtypes):
+    # casts the declared columns that are present, leaves the rest alone
+    present = {col: dtype for col, dtype in dtypes.items() if col in df.columns}
+    return df.astype(present)
+
+
+def memory_report(df, stage):
+    # deep memory usage, so object strings are counted too
+    mb = df.memory_usage(deep=True).sum() / 1024 ** 2
+    print(f"[memory] {stage}: {len(df)} rows x {df.shape[1]} cols, {mb:.1f} MB")
+    return {"stage": stage, "rows": len(df), "mb": round(mb, 2)}
@@ -0,0 +1,165 @@
+import os
+import time
+
+import pandas as pd
+from sqlalchemy import text
+
+from etl.aggregates import GROUP_COLUMNS, group_keys, deleted_group_keys, merge_group_keys, refresh_aggregates
+from etl.bulk import write_table
+from etl.defaults import MATCH_SHARDS
+from etl.incremental import hash_rows, update_pairs, full_pairs, pair_positions, fact_row_hashes
+from etl.matching import match_pairs, join_matches
+from etl.normalize import ArtistCache
+from etl.partitions import extend_partitions, warehouse_digests, changed_partitions, reload_partitions, partition_name
+from etl.star import DIMENSIONS, build_star, star_frame
+from etl.transform import GRAMMY_KEY, clean_grammy, annotate_artists, finalize_merged
+
+# transform and load steps of etl_pipeline as plain functions, so they can run (and be
+# benchmarked) without airflow; the tasks only add artifacts, state and logging around them
+
+DELETE_BATCH = 1000
+
+
+def clean_grammy_keyed(df1):
+    # cleaned grammy rows plus their natural key hash
+    df1 = clean_grammy(df1)
+    df1["grammy_uk"] = hash_rows(df1, GRAMMY_KEY)
+    return df1
+
+
+def normalize_sources(sp_current, gr_current, cache=None):
+    # artist lists and flags, once per distinct artist string
+    cache = cache if cache is not None else ArtistCache(path=None)
+    return annotate_artists(sp_current, gr_current, cache)
+
+
+def match_sources(sp, gr, old_pairs=None, changed_ids=None, new_grammy_uks=None, title_thr=90, artist_thr=90,
+                  cache=None):
+    # blocked fuzzy matching; with old pairs only changed rows are scored again, and with a
+    # MatchCache only pairs no earlier run has decided
+    matcher = lambda left, right: match_pairs(left, right, title_thr=title_thr, artist_thr=artist_thr, cache=cache)
+    if old_pairs is None:
+        return full_pairs(sp, gr, matcher)
+    return update_pairs(old_pairs, sp, gr, changed_ids, new_grammy_uks, matcher)
+
+
+def split_shards(sp, count=MATCH_SHARDS):
+    # spotify rows split by track_id hash; each shard is matched against every grammy row,
+    # and pair decisions only depend on the pair, so the union equals an unsharded match
+    shard = hash_rows(sp, ["track_id"]).view("uint64") % count
+    return [sp[shard == i].reset_index(drop=True) for i in range(count)]
+
+
+def merge_sources(sp, gr, pairs):
+    # outer-style join of the matched pairs, cleaned and typed. Pairs come concatenated in shard
+    # (or state + delta) order; sorting by position makes the row order independent of both
+    positions = pair_positions(pairs, sp, gr).sort_values(["sp_row", "gr_row"], kind="mergesort")
+    return finalize_merged(join_matches(sp, gr, positions.reset_index(drop=True)))
+
+
+def write_merged_csv(merged_full, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    merged_full.to_csv(path, index=False, encoding="utf-8-sig")
+    return path
+
+
+def fact_delta(merged_full, old_hashes=None):
+    # rows to insert and row hashes to delete against what the warehouse already holds
+    merged_full = merged_full.copy()
+    merged_full["row_hash"] = fact_row_hashes(merged_full)
+    if old_hashes is None:
+        old_hashes = pd.Series([], dtype="int64", name="row_hash")
+    inserted = merged_full[~merged_full["row_hash"].isin(old_hashes)]
+    deleted = old_hashes[~old_hashes.isin(merged_full["row_hash"])].to_frame()
+    return merged_full, inserted, deleted
+
+
+def delete_fact_rows(engine, hashes, schema=None):
+    table = f"{schema}.fact_track_metrics" if schema else "fact_track_metrics"
+    hashes = list(hashes)
+    with engine.begin() as conn:
+        for start in range(0, len(hashes), DELETE_BATCH):
+            chunk = hashes[start:start + DELETE_BATCH]
+            params = {f"h{i}": int(h) for i, h in enumerate(chunk)}
+            placeholders = ", ".join(f":h{i}" for i in range(len(chunk)))
+            conn.execute(text(f"DELETE FROM {table} WHERE row_hash IN ({placeholders})"), params)
+
+
+def prune_dimensions(engine, schema=None):
+    # dimension rows no fact row points at any more (a renamed artist, a dropped album list);
+    # the fact has an index on every key, so each delete is an anti join over it
+    fact = f"{schema}.fact_track_metrics" if schema else "fact_track_metrics"
+    pruned = {}
+    with engine.begin() as conn:
+        for table, key, _, _ in DIMENSIONS:
+            qualified = f"{schema}.{table}" if schema else table
+            result = conn.execute(text(f"DELETE FROM {qualified} WHERE NOT EXISTS "
+                                       f"(SELECT 1 FROM {fact} f WHERE f.{key} = {qualified}.{key})"))
+            pruned[table] = result.rowcount
+    return pruned
+
+
+def load_star(engine, df, deleted=(), schema=None, ddl=(), bulk_method="auto", recreate=False, aggregates=True,
+              replace_partitions=False, workers=1):
+    # df is a prepared frame or the memory mapped arrow table of the merged artifact; returns
+    # the per-table load stats. replace_partitions: df is the whole dataset and only the fact
+    # partitions (years) whose rows changed are rewritten. workers: parallel fact writers
+    with engine.begin() as conn:
+        for stmt in ddl:
+            conn.execute(text(stmt))
+
+    # dimensions and fact, surrogate keys are hashes of the natural keys
+    dims, fact = build_star(df)
+
+    # existing keys are never duplicated: key-only dimensions skip them, dimensions with
+    # attributes (dim_track.track_name) overwrite them so a renamed track is updated
+    load_stats = []
+    attributes = {table: attrs for table, _, _, attrs in DIMENSIONS}
+    for table, dim in dims.items():
+        replace = not recreate and bool(attributes[table])
+        load_stats.append(write_table(engine, dim, table, schema=schema, method=bulk_method,
+                                      relax_checks=recreate, ignore_duplicates=not recreate and not replace,
+                                      replace_duplicates=replace))
+
+    # award years past the last partition get their own before any fact row is written
+    if len(fact):
+        extend_partitions(engine, int(fact["year"].max()), schema=schema)
+
+    if replace_partitions and not recreate:
+        labels = changed_partitions(fact, warehouse_digests(engine, schema=schema))
+        print(f"Fact partitions to reload: {[partition_name(label) for label in labels] or 'none'}")
+        load_stats += reload_partitions(engine, fact, labels, schema=schema, method=bulk_method,
+                                        workers=workers)
+    else:
+        # summary groups of the rows about to change, deleted ones have to be read before they go
+        groups = None
+        if aggregates and not recreate:
+            groups = group_keys(star_frame(df, GROUP_COLUMNS))
+            if len(deleted):
+                groups = merge_group_keys(groups, deleted_group_keys(engine, deleted, schema=schema))
+
+        # drop fact rows that are no longer part of the merged dataset, and any copy of the rows
+        # about to be inserted: the delta comes from the state hashes, which only move on after
+        # the load, so a retried load finds its own rows from the failed attempt in the table
+        if not recreate and (len(deleted) or len(fact)):
+            stale = pd.concat([pd.Series(deleted, dtype="int64"), fact["row_hash"]], ignore_index=True)
+            delete_fact_rows(engine, stale, schema=schema)
+
+        # parallel slices commit together; if one commit fails the ones already committed are
+        # deleted again by row hash (none of these hashes is left in the table at this point)
+        load_stats.append(write_table(engine, fact, "fact_track_metrics", schema=schema,
+                                      method=bulk_method, relax_checks=recreate, workers=workers,
+                                      cleanup=lambda rows: delete_fact_rows(engine, rows["row_hash"], schema=schema)))
+
+    # fact rows that were deleted or rewritten can leave dimension rows behind
+    if not recreate:
+        start = time.perf_counter()
+        pruned = prune_dimensions(engine, schema=schema)
+        print(f"Unreferenced dimension rows removed in {time.perf_counter() - start:.2f}s: {pruned}")
+
+    # full loads rebuild the summary tables, patch loads recompute the touched groups
+    if aggregates:
+        start = time.perf_counter()
+        refreshed = refresh_aggregates(engine, None if replace_partitions else groups, schema=schema)
+        print(f"Aggregates refreshed in {time.perf_counter() - start:.2f}s: {refreshed}")
+    return load_stats
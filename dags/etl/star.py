@@ -0,0 +1,210 @@
+import numpy as np
+import pandas as pd
+
+from etl.incremental import hash_rows
+from etl.partitions import partition_clause
+from etl.schema import MERGED_DTYPES, apply_schema
+
+# table, surrogate key, natural key columns of the merged frame, extra attributes
+DIMENSIONS = [
+    ("dim_track", "track_key", ["track_id"], ["track_name"]),
+    ("dim_artist", "artist_key", ["artist_spotify"], []),
+    ("dim_album", "album_key", ["album_name", "album_others"], []),
+    ("dim_genre", "genre_key", ["main_genre", "sub_genre"], []),
+    ("dim_time", "time_key", ["year"], []),
+    ("dim_grammy", "grammy_key", ["title", "category", "nominee", "artist_grammy"], []),
+]
+DIM_RENAMES = {"dim_track": {"track_id": "track_spotify_id"}}
+
+FACT_COLUMNS = [
+    "track_key", "artist_key", "album_key", "genre_key", "time_key", "grammy_key", "year",
+    "popularity", "duration_min", "explicit", "danceability", "energy", "loudness",
+    "speechiness", "acousticness", "instrumentalness", "liveness", "valence", "tempo",
+    "grammy_nominee", "row_hash",
+]
+# fact columns copied from the merged frame, the keys come from the dimensions
+FACT_MEASURES = [col for col in FACT_COLUMNS if col not in {key for _, key, _, _ in DIMENSIONS}]
+
+
+def star_ddl(schema_name, recreate_schema=False, last_year=None):
+    # mysql DDL of the full_dw star schema
+    ddl = []
+    if recreate_schema:
+        ddl.append(f"DROP DATABASE IF EXISTS {schema_name}")
+    ddl.append(f"CREATE DATABASE IF NOT EXISTS {schema_name}")
+
+    ddl += [
+        f"""
+        CREATE TABLE IF NOT EXISTS {schema_name}.dim_track (
+            track_key BIGINT PRIMARY KEY,
+            track_spotify_id VARCHAR(64) NOT NULL UNIQUE,
+            track_name TEXT NOT NULL
+        ) ENGINE=InnoDB
+        DEFAULT CHARSET=utf8mb4
+        COLLATE=utf8mb4_unicode_ci;
+        """,
+
+        f"""
+        CREATE TABLE IF NOT EXISTS {schema_name}.dim_artist (
+            artist_key BIGINT PRIMARY KEY,
+            artist_spotify TEXT NOT NULL,
+            INDEX idx_artist_name (artist_spotify(191))
+        ) ENGINE=InnoDB
+        DEFAULT CHARSET=utf8mb4
+        COLLATE=utf8mb4_unicode_ci;
+        """,
+
+        f"""
+        CREATE TABLE IF NOT EXISTS {schema_name}.dim_album (
+            album_key BIGINT PRIMARY KEY,
+            album_name   TEXT NOT NULL,
+            album_others TEXT NOT NULL,
+            INDEX idx_album (album_name(191), album_others(191))
+        ) ENGINE=InnoDB
+        DEFAULT CHARSET=utf8mb4
+        COLLATE=utf8mb4_unicode_ci
+        """,
+        f"""
+        CREATE TABLE IF NOT EXISTS {schema_name}.dim_genre (
+            genre_key BIGINT PRIMARY KEY,
+            main_genre VARCHAR(100) NOT NULL,
+            sub_genre  VARCHAR(100) NOT NULL,
+            UNIQUE(main_genre, sub_genre)
+        ) ENGINE=InnoDB;
+        """,
+        f"""
+        CREATE TABLE IF NOT EXISTS {schema_name}.dim_time (
+            time_key BIGINT PRIMARY KEY,
+            year SMALLINT NOT NULL UNIQUE
+        ) ENGINE=InnoDB;
+        """,
+
+        f"""
+        CREATE TABLE IF NOT EXISTS {schema_name}.dim_grammy (
+            grammy_key BIGINT PRIMARY KEY,
+            title         VARCHAR(191) NOT NULL,
+            category      VARCHAR(128) NOT NULL,
+            nominee       VARCHAR(191) NOT NULL,
+            artist_grammy TEXT NOT NULL,
+            grammy_uk CHAR(64)
+            AS (SHA2(CONCAT_WS('|', title, category, nominee, artist_grammy), 256)) STORED,
+            UNIQUE KEY uq_dim_grammy (grammy_uk)
+        ) ENGINE=InnoDB
+        DEFAULT CHARSET=utf8mb4
+        COLLATE=utf8mb4_unicode_ci;
+        """,
+        f"""
+        CREATE TABLE IF NOT EXISTS {schema_name}.fact_track_metrics (
+            fact_id BIGINT AUTO_INCREMENT,
+            track_key  BIGINT NOT NULL,
+            artist_key BIGINT NOT NULL,
+            album_key  BIGINT NOT NULL,
+            genre_key  BIGINT NOT NULL,
+            time_key   BIGINT NOT NULL,
+            grammy_key BIGINT NOT NULL,
+            year       SMALLINT NOT NULL,
+            popularity       DOUBLE NOT NULL,
+            duration_min     DOUBLE NOT NULL,
+            explicit         TINYINT(1) NOT NULL,
+            danceability     DOUBLE NOT NULL,
+            energy           DOUBLE NOT NULL,
+            loudness         DOUBLE NOT NULL,
+            speechiness      DOUBLE NOT NULL,
+            acousticness     DOUBLE NOT NULL,
+            instrumentalness DOUBLE NOT NULL,
+            liveness         DOUBLE NOT NULL,
+            valence          DOUBLE NOT NULL,
+            tempo            DOUBLE NOT NULL,
+            grammy_nominee   TINYINT(1) NOT NULL,
+            row_hash         BIGINT NOT NULL,
+            -- partitioned tables can't have foreign keys and every unique key needs the
+            -- partition column; the keys are hashes of the dimension rows, joins use these indexes
+            PRIMARY KEY (fact_id, year),
+            INDEX idx_fact_row_hash (row_hash),
+            INDEX idx_fact_track (track_key),
+            INDEX idx_fact_artist (artist_key),
+            INDEX idx_fact_album (album_key),
+            INDEX idx_fact_genre (genre_key),
+            INDEX idx_fact_time (time_key),
+            INDEX idx_fact_grammy (grammy_key)
+        ) ENGINE=InnoDB
+        {partition_clause(last_year)};
+        """,
+    ]
+    return ddl
+
+
+def surrogate_key(df, columns):
+    # 64-bit hash of the natural key as text, the same value on every run and every machine
+    return hash_rows(df[columns].astype(str))
+
+
+def prepare(df):
+    df = df.copy()
+
+    # Normalizes booleans if they come as text
+    for col in ["explicit", "grammy_nominee"]:
+        if col not in df.columns:
+            continue
+        if pd.api.types.is_bool_dtype(df[col]):
+            df[col] = df[col].fillna(False).astype(bool)
+        else:
+            df[col] = (
+                df[col].astype(str).str.strip().str.lower()
+                .map({"true": True, "1": True, "false": False, "0": False})
+                .fillna(False)
+            )
+
+    # NOT NULL
+    for col in ["album_name", "album_others", "title", "category", "nominee",
+                "artist_grammy", "artist_spotify", "track_name", "main_genre", "sub_genre"]:
+        if col in df.columns:
+            if isinstance(df[col].dtype, pd.CategoricalDtype) and "" not in df[col].cat.categories:
+                df[col] = df[col].cat.add_categories("")
+            df[col] = df[col].fillna("")
+    if "year" in df.columns:
+        df["year"] = df["year"].fillna(0).astype("int16")
+    return df
+
+
+def exact_floats(df):
+    # float32 measures are an in-memory format only: executemany would store the widened
+    # float32 (0.6759999990463257) in the DOUBLE columns, LOAD DATA its text ("0.676").
+    # Each float32 column becomes the float64 of that text, so every writer stores the same
+    # value; converted once per distinct value, the measures repeat a lot.
+    floats = df.select_dtypes(include=["float32"]).columns
+    if not len(floats):
+        return df
+    df = df.copy()
+    for col in floats:
+        codes, uniques = pd.factorize(df[col])
+        values = np.append(np.asarray(uniques).astype(str).astype(np.float64), np.nan)
+        df[col] = values[codes]
+    return df
+
+
+def star_frame(source, columns):
+    # columns of the merged dataset: a prepared frame, or an arrow table (memory mapped
+    # artifact) of which only these columns are converted, prepared and typed
+    if isinstance(source, pd.DataFrame):
+        return exact_floats(source[columns])
+    return exact_floats(apply_schema(prepare(source.select(columns).to_pandas(split_blocks=True)), MERGED_DTYPES))
+
+
+def build_star(source):
+    # dimension frames with their keys plus the fact frame, keys resolved without any db read-back;
+    # each table only reads the columns it is built from
+    fact = {}
+    dims = {}
+    for table, key, natural, attributes in DIMENSIONS:
+        df = star_frame(source, natural + attributes)
+        fact[key] = surrogate_key(df, natural)
+        dim = df.assign(**{key: fact[key]})
+        dim = dim.drop_duplicates(subset=key)[[key] + natural + attributes]
+        dims[table] = dim.rename(columns=DIM_RENAMES.get(table, {})).reset_index(drop=True)
+
+    measures = star_frame(source, FACT_MEASURES).reset_index(drop=True)
+    fact = pd.concat([pd.DataFrame(fact), measures], axis=1)
+    fact["explicit"] = fact["explicit"].astype(int)
+    fact["grammy_nominee"] = fact["grammy_nominee"].astype(int)
+    return dims, fact[FACT_COLUMNS].reset_index(drop=True)
@@ -0,0 +1,148 @@
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import text
+
+from etl.defaults import CHUNK_SIZE, GRAMMY_BATCH_SIZE
+from etl.incremental import hash_rows
+from etl.schema import SPOTIFY_DTYPES, GRAMMY_BATCH_DTYPES, apply_schema
+from etl.transform import clean_spotify_rows, resolve_duplicates, consolidate_albums
+
+PARTITIONS = 16
+
+# what the transform reads from grammy_awards; workers, img, published_at and winner are dropped
+GRAMMY_COLUMNS = ["year", "title", "category", "nominee", "artist", "updated_at"]
+# the natural key columns, read on incremental runs to find rows that changed key or are gone
+GRAMMY_KEY_COLUMNS = ["title", "category", "nominee", "artist"]
+
+
+def read_spotify_chunks(path, chunksize=CHUNK_SIZE):
+    # declared dtypes, so every chunk gets the same schema
+    return pd.read_csv(path, chunksize=chunksize, dtype=SPOTIFY_DTYPES)
+
+
+# updated_at is ISO text carrying the local offset of the day (-07:00 or -08:00), so the
+# strings don't sort in time order; the watermark is compared against it in UTC
+UPDATED_AT_UTC = {
+    "mysql": "CONVERT_TZ(STR_TO_DATE(LEFT(updated_at, 19), '%Y-%m-%dT%H:%i:%s'), RIGHT(updated_at, 6), '+00:00')",
+    # sqlite's date functions apply a trailing [+-]HH:MM offset themselves
+    "sqlite": "datetime(updated_at)",
+}
+
+
+def grammy_query(columns=GRAMMY_COLUMNS, year_from=None, year_to=None, updated_after=None, dialect="mysql"):
+    # projection and filters run on the server, so only what the transform uses is sent.
+    # updated_after is a UTC "YYYY-MM-DD HH:MM:SS" watermark; rows stamped in that same second
+    # are read again (>=), re-reading a row is harmless as merge_grammy keeps one per key
+    where, params = [], {}
+    if year_from is not None:
+        where.append("year >= :year_from")
+        params["year_from"] = int(year_from)
+    if year_to is not None:
+        where.append("year <= :year_to")
+        params["year_to"] = int(year_to)
+    if updated_after is not None:
+        where.append(f"{UPDATED_AT_UTC[dialect]} >= :updated_after")
+        params["updated_after"] = updated_after
+    sql = f"SELECT {', '.join(columns)} FROM grammy_awards"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql, params
+
+
+def read_grammy_batches(engine, sql, params=None, batch_size=GRAMMY_BATCH_SIZE, stats=None):
+    # stream_results opens an unbuffered server-side cursor (SSCursor on mysqlclient), so the
+    # client holds one batch at a time; stats gets the rows, batches and decoded bytes
+    stats = stats if stats is not None else {}
+    stats.update(rows=0, batches=0, bytes=0)
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, max_row_buffer=batch_size).execute(
+            text(sql), params or {})
+        columns = list(result.keys())
+        for rows in result.partitions(batch_size):
+            batch = apply_schema(pd.DataFrame.from_records(rows, columns=columns), GRAMMY_BATCH_DTYPES)
+            stats["rows"] += len(batch)
+            stats["batches"] += 1
+            stats["bytes"] += int(batch.memory_usage(deep=True, index=False).sum())
+            yield batch
+    # an empty result still needs a staging file with the projected columns
+    if not stats["batches"]:
+        yield apply_schema(pd.DataFrame(columns=columns), GRAMMY_BATCH_DTYPES)
+
+
+def _spill(frames, keys, spill_dir, partitions):
+    # hash-partitions every frame on keys into one parquet file per partition, so all rows
+    # of a key end up in the same file, in their original order
+    writers = {}
+    schema = None
+    try:
+        for frame in frames:
+            if frame.empty:
+                continue
+            part = hash_rows(frame, keys).view("uint64") % partitions
+            for p in pd.unique(part):
+                piece = frame[part == p]
+                if schema is None:
+                    schema = pa.Table.from_pandas(piece, preserve_index=False).schema
+                table = pa.Table.from_pandas(piece, schema=schema, preserve_index=False)
+                if p not in writers:
+                    writers[p] = pq.ParquetWriter(os.path.join(spill_dir, f"part-{p:04d}.parquet"), schema)
+                writers[p].write_table(table)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return [os.path.join(spill_dir, f"part-{p:04d}.parquet") for p in sorted(writers)]
+
+
+def _read_partitions(paths, func):
+    for path in paths:
+        yield func(pq.read_table(path).to_pandas())
+
+
+def clean_spotify_streaming(chunks, partitions=PARTITIONS, spill_dir=None, template=None):
+    # clean_spotify with bounded memory: row steps per chunk, then each dedup stage runs one
+    # hash partition at a time (track_id for duplicates, track_name + artists for albums).
+    # template: empty raw frame with the source columns, the result when chunks yields nothing
+    spill_root = tempfile.mkdtemp(prefix="spotify_spill_", dir=spill_dir)
+    try:
+        by_track = os.path.join(spill_root, "track_id")
+        by_name = os.path.join(spill_root, "track_name_artists")
+        os.makedirs(by_track)
+        os.makedirs(by_name)
+
+        rows = 0
+        empty = None
+
+        def cleaned():
+            nonlocal rows, empty
+            for chunk in chunks:
+                chunk = clean_spotify_rows(chunk)
+                rows += len(chunk)
+                if empty is None:
+                    empty = chunk.iloc[:0]
+                yield chunk
+
+        track_parts = _spill(cleaned(), ["track_id"], by_track, partitions)
+        print("Spotify rows after initial cleaning:", rows)
+
+        name_parts = _spill(_read_partitions(track_parts, resolve_duplicates),
+                            ["track_name", "artists"], by_name, partitions)
+        # resolve_duplicates output is ordered by track_id in memory; restoring that order per
+        # partition keeps tie-breaks and album_others order identical to clean_spotify
+        consolidated = list(_read_partitions(
+            name_parts, lambda part: consolidate_albums(part.sort_values("track_id", kind="mergesort"))))
+    finally:
+        shutil.rmtree(spill_root, ignore_errors=True)
+
+    if not consolidated:
+        if empty is None:
+            if template is None:
+                raise ValueError("No spotify chunks and no template to take the columns from")
+            empty = clean_spotify_rows(template.iloc[:0])
+        return consolidate_albums(resolve_duplicates(empty))
+    df = pd.concat(consolidated, ignore_index=True)
+    return df.sort_values(["track_name", "artists"], kind="mergesort").reset_index(drop=True)
@@ -0,0 +1,223 @@
+import numpy as np
+import pandas as pd
+
+from etl.normalize import normalize_artist_column
+from etl.schema import SPOTIFY_CLEAN_DTYPES, MERGED_DTYPES, apply_schema
+
+# normalize synonyms in track_genre
+NORMALIZE_MAPPING = {"latino": "latin", "kids": "children"}
+
+# map sub-genres to main buckets
+GENRE_MAPPING = {
+    # rock
+    "alt-rock": "rock", "hard-rock": "rock", "punk-rock": "rock",
+    "rock-n-roll": "rock", "rockabilly": "rock", "grunge": "rock",
+    "psych-rock": "rock", "punk": "rock", "rock": "rock",
+    # metal
+    "metal": "metal", "black-metal": "metal", "death-metal": "metal",
+    "heavy-metal": "metal", "metalcore": "metal", "grindcore": "metal",
+    # pop
+    "pop": "pop", "indie-pop": "pop", "power-pop": "pop",
+    "synth-pop": "pop", "pop-film": "pop", "k-pop": "pop",
+    "j-pop": "pop", "mandopop": "pop", "cantopop": "pop",
+    # electronic
+    "edm": "electronic", "electro": "electronic", "electronic": "electronic",
+    "deep-house": "electronic", "detroit-techno": "electronic", "techno": "electronic",
+    "house": "electronic", "progressive-house": "electronic", "chicago-house": "electronic",
+    "trance": "electronic", "dubstep": "electronic", "drum-and-bass": "electronic",
+    "idm": "electronic", "trip-hop": "electronic", "minimal-techno": "electronic",
+    "club": "electronic", "dance": "electronic", "dancehall": "electronic",
+    "disco": "electronic", "dub": "electronic", "garage": "electronic",
+    "breakbeat": "electronic",
+    # hip hop / r&b
+    "hip-hop": "hip-hop", "r-n-b": "hip-hop",
+    # jazz / blues
+    "jazz": "jazz", "blues": "blues", "bluegrass": "blues",
+    # latin
+    "latin": "latin", "salsa": "latin", "samba": "latin", "pagode": "latin",
+    "sertanejo": "latin", "brazil": "latin", "forro": "latin", "mpb": "latin",
+    # other mains
+    "country": "country", "folk": "folk", "gospel": "gospel",
+    "opera": "classical", "classical": "classical", "piano": "classical",
+    "acoustic": "acoustic", "singer-songwriter": "acoustic", "songwriter": "acoustic",
+    # j-music
+    "anime": "j-music", "j-rock": "j-music", "j-idol": "j-music", "j-dance": "j-music",
+    # misc
+    "alternative": "alternative", "ambient": "ambient", "world-music": "world",
+    "afrobeat": "world", "indian": "world", "iranian": "world", "turkish": "world",
+    "swedish": "world", "french": "world", "german": "world", "spanish": "world",
+    "malay": "world", "emo": "emo", "hardcore": "hardcore", "hardstyle": "hardstyle",
+    "industrial": "industrial", "goth": "goth", "groove": "groove",
+    "funk": "funk", "soul": "soul", "comedy": "comedy", "children": "children",
+    "disney": "children", "study": "study", "sleep": "study", "happy": "mood",
+    "sad": "mood", "romance": "mood", "party": "mood", "show-tunes": "theatre",
+    "new-age": "new-age", "chill": "chill", "guitar": "instrumental",
+}
+
+GRAMMY_KEY = ["title", "category", "nominee", "artist"]
+
+
+def _top_by_popularity(df, keys):
+    # stable sort keeps the first row among equal popularity, same as idxmax
+    ranked = df.sort_values("popularity", ascending=False, kind="mergesort")
+    return ranked.drop_duplicates(subset=keys, keep="first")
+
+
+def resolve_duplicates(df):
+    # one row per track_id (most popular) and the remaining sub-genres joined in sub_genre
+    main = _top_by_popularity(df, ["track_id"])
+
+    subgenres = df[["track_id", "sub_genre"]].dropna().drop_duplicates()
+    subgenres = subgenres.merge(main[["track_id", "main_genre"]], on="track_id", how="left")
+    subgenres = subgenres[subgenres["sub_genre"] != subgenres["main_genre"]]
+    joined = (subgenres.sort_values(["track_id", "sub_genre"])
+              .groupby("track_id")["sub_genre"].agg(", ".join))
+
+    main = main.sort_values("track_id", kind="mergesort").reset_index(drop=True)
+    main["sub_genre"] = main["track_id"].map(joined).astype(object)
+    main["sub_genre"] = main["sub_genre"].where(main["sub_genre"].notna(), None)
+    return main
+
+
+def consolidate_albums(df, keys=("track_name", "artists")):
+    # one row per track_name + artists (most popular) and the other albums listed in album_others
+    keys = list(keys)
+    df = df.dropna(subset=keys)
+    main = _top_by_popularity(df, keys)
+
+    albums = df[keys + ["album_name"]].drop_duplicates()
+    albums = albums.merge(main[keys + ["album_name"]].rename(columns={"album_name": "main_album"}),
+                          on=keys, how="left")
+    albums = albums[albums["album_name"] != albums["main_album"]]
+    joined = albums.groupby(keys, sort=False)["album_name"].agg("; ".join).rename("album_others")
+
+    main = main.sort_values(keys, kind="mergesort").reset_index(drop=True)
+    main = main.merge(joined.reset_index(), on=keys, how="left")
+    main["album_others"] = main["album_others"].astype(object)
+    main["album_others"] = main["album_others"].where(main["album_others"].notna(), None)
+    return main
+
+
+def clean_spotify_rows(df):
+    # row-local steps only, safe to run chunk by chunk
+    # drop helper index column if present
+    if "Unnamed: 0" in df.columns:
+        df = df.drop(columns=["Unnamed: 0"])
+
+    # drop unwanted columns (ignore if missing)
+    cols_to_drop = ["key", "mode", "time_signature", "winner"]
+    df = df.drop(columns=[c for c in cols_to_drop if c in df.columns], errors="ignore")
+
+    # drop rows with any nulls
+    df = df.dropna().drop_duplicates(keep="first")
+    df = apply_schema(df, SPOTIFY_CLEAN_DTYPES)
+
+    # normalize synonyms in track_genre
+    df["track_genre"] = df["track_genre"].replace(NORMALIZE_MAPPING)
+
+    # create sub_genre and main_genre
+    df["sub_genre"] = df["track_genre"]
+    df["main_genre"] = df["track_genre"].map(GENRE_MAPPING).fillna(df["track_genre"])
+    df = df.drop(columns=["track_genre"])
+
+    # duration in minutes
+    df["duration_ms"] = (df["duration_ms"] / 60000).astype("float32")
+    df = df.rename(columns={"duration_ms": "duration_min"})
+
+    # clip positive loudness to 0
+    df.loc[df["loudness"] > 0, "loudness"] = 0
+
+    # normalize text columns
+    for col in ["artists", "album_name", "track_name"]:
+        df[col] = df[col].str.lower().str.strip()
+    return df
+
+
+def clean_spotify(df):
+    df = clean_spotify_rows(df)
+    print("Spotify shape after initial cleaning:", df.shape)
+
+    # resolve duplicates by track_id, then consolidate by track_name + artists
+    return consolidate_albums(resolve_duplicates(df))
+
+
+def _clean_text(col):
+    # lower + strip; a categorical only cleans its categories (merging those that become equal)
+    # and remaps the codes, missing values turn into "nan" as astype(str) gives plain columns
+    if not isinstance(col.dtype, pd.CategoricalDtype):
+        return col.astype(str).str.lower().str.strip()
+    labels = pd.Index(col.cat.categories.astype(str).str.lower().str.strip().tolist() + ["nan"])
+    label_codes, uniques = pd.factorize(labels)
+    codes = col.cat.codes.to_numpy()
+    codes = label_codes[np.where(codes >= 0, codes, len(labels) - 1)]
+    cleaned = pd.Categorical.from_codes(codes, categories=uniques).remove_unused_categories()
+    return pd.Series(cleaned, index=col.index, name=col.name)
+
+
+def clean_grammy(df1):
+    # drop unused columns
+    df1 = df1.drop(columns=["winner", "workers", "img", "published_at", "updated_at"], errors="ignore")
+
+    # normalize text; title and category stay categorical (GRAMMY_DTYPES)
+    for col in GRAMMY_KEY:
+        df1[col] = _clean_text(df1[col])
+
+    # fill empty nominee/artist
+    for col in ["nominee", "artist"]:
+        df1[col] = df1[col].replace("nan", "").replace("", "not specified").fillna("not specified")
+    return df1
+
+
+def annotate_artists(df, df1, cache):
+    # artist lists and various-artists flag, once per distinct artist string
+    df = df.copy()
+    df1 = df1.copy()
+    df["artist_list_spotify"], _ = normalize_artist_column(df["artists"], cache)
+    df1["artist_list_grammy"], df1["is_various_artists"] = normalize_artist_column(df1["artist"], cache)
+    return df, df1
+
+
+def finalize_merged(merged_full):
+    # handle nans and types
+    if "explicit" in merged_full.columns:
+        merged_full["explicit"] = merged_full["explicit"].astype("boolean").fillna(False)
+    else:
+        merged_full["explicit"] = False
+
+    obj_cols = [c for c in merged_full.select_dtypes(include=["object"]).columns if c != "explicit"]
+    merged_full[obj_cols] = merged_full[obj_cols].fillna("not specified")
+    # grammy title/category stay categorical through the join, unpaired spotify rows need the label
+    for c in merged_full.select_dtypes(include=["category"]).columns:
+        if merged_full[c].isna().any():
+            if "not specified" not in merged_full[c].cat.categories:
+                merged_full[c] = merged_full[c].cat.add_categories(["not specified"])
+            merged_full[c] = merged_full[c].fillna("not specified")
+
+    num_cols = merged_full.select_dtypes(include=[np.number]).columns.tolist()
+    merged_full[num_cols] = merged_full[num_cols].fillna(0)
+
+    # rename and drop helper cols
+    merged_full["artist_spotify"] = merged_full.get("artists", None)
+    merged_full["artist_grammy"] = merged_full.get("artist", None)
+
+    merged_full = merged_full.drop(
+        columns=["artists", "artist", "artist_list_spotify", "artist_list_grammy", "is_various_artists", "grammy_uk"],
+        errors="ignore"
+    )
+
+    # reorder columns
+    cols_spotify = [
+        "track_id", "track_name", "artist_spotify", "album_name", "album_others",
+        "popularity", "duration_min", "explicit", "danceability", "energy", "loudness",
+        "speechiness", "acousticness", "instrumentalness", "liveness", "valence", "tempo",
+        "main_genre", "sub_genre"
+    ]
+    cols_grammy = ["year", "title", "category", "nominee", "artist_grammy", "grammy_nominee"]
+    cols_spotify = [c for c in cols_spotify if c in merged_full.columns]
+    cols_grammy = [c for c in cols_grammy if c in merged_full.columns]
+    cols_rest = [c for c in merged_full.columns if c not in cols_spotify + cols_grammy]
+    merged_full = merged_full[cols_spotify + cols_grammy + cols_rest]
+
+    for c in merged_full.select_dtypes(include=["boolean", "bool"]).columns:
+        merged_full[c] = merged_full[c].astype(bool)
+    return apply_schema(merged_full, MERGED_DTYPES)
@@ -1,23 +1,19 @@
 from airflow.decorators import dag, task
 from datetime import datetime
-from airflow.providers.mysql.hooks.mysql import MySqlHook
-from sqlalchemy import text
-from sqlalchemy.dialects.mysql import TINYINT, DOUBLE, VARCHAR, SMALLINT, INTEGER
-import pandas as pd
-import numpy as np
-import json
 import os
-import re
-import unicodedata
-from rapidfuzz import fuzz
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
-from google.auth.transport.requests import Request
+from etl.defaults import CHUNK_SIZE, GRAMMY_BATCH_SIZE, MATCH_SHARDS, DRIVE_CHUNK_SIZE, LOAD_WORKERS, KEEP_RUNS
 
+# the scheduler re-parses this file all the time, so only the graph is built at import:
+# pandas, pyarrow, rapidfuzz, sqlalchemy, the mysql hook and the google clients are
+# imported inside the tasks that use them
+
+SPOTIFY_PATH = "/opt/airflow/data/spotify_dataset.csv"
 TOKEN_PATH = "/opt/airflow/dags/token.json"   
 FOLDER_ID  = "1wlc8q98XUC4zrN-FdCqVULPnDur9o7ia"              
 OUT_PATH   = "/opt/airflow/dags/data/spotify_grammy_full.csv"
+REPORT_PATH = os.path.join(os.path.dirname(OUT_PATH), "run_report.json")
+INSTRUMENTED_TASKS = ("extract_spotify_csv", "extract_grammy_db", "clean_spotify_source", "clean_grammy_source",
+                      "plan_matching", "merge_and_export", "load_to_drive", "load_star_schema")
 
 @dag(
     dag_id="etl_pipeline",
@@ -25,476 +21,460 @@ OUT_PATH   = "/opt/airflow/dags/data/spotify_grammy_full.csv"
     schedule_interval="@daily",
     catchup=False,
     max_active_runs=1,
-    tags=["spotify", "grammys", "etl"]
+    tags=["spotify", "grammys", "etl"],
+    params={"full_refresh": False, "streaming": False, "chunksize": CHUNK_SIZE, "match_shards": MATCH_SHARDS,
+            "match_cache": True, "grammy_year_from": None, "grammy_year_to": None,
+            "grammy_batch_size": GRAMMY_BATCH_SIZE, "recreate_schema": False, "engine": "pandas",
+            "engine_memory_limit": "", "drive_export": True, "drive_format": "gzip",
+            "drive_chunksize": DRIVE_CHUNK_SIZE, "drive_retries": 5, "load_workers": LOAD_WORKERS,
+            "keep_runs": KEEP_RUNS, "profile_stage": ""},
 )
 def etl_pipeline():
 
     @task()
-    def extract_spotify_csv():
-        file_path = "/opt/airflow/data/spotify_dataset.csv"
-        df_spotify = pd.read_csv(file_path)
-        print(df_spotify.head())
-        return df_spotify.to_json(orient='records')
+    def extract_spotify_csv(run_id=None, params=None, ti=None):
+        import pandas as pd
+        from etl.artifacts import write_artifact, write_artifact_chunks
+        from etl.incremental import resolve_mode, read_state, spotify_snapshot, affected_track_ids
+        from etl.metrics import task_metrics
+        from etl.schema import SPOTIFY_DTYPES, memory_report
+        from etl.streaming import read_spotify_chunks
+
+        metrics = task_metrics("extract_spotify_csv", ti, params, run_id)
+        mode = resolve_mode(params)
+        streaming = bool((params or {}).get("streaming"))
+        chunksize = int((params or {}).get("chunksize") or CHUNK_SIZE)
+
+        # row hashes decide which tracks go through transform in incremental mode
+        with metrics.stage("read_snapshot") as stage:
+            if streaming:
+                snapshot = pd.concat([spotify_snapshot(chunk) for chunk in read_spotify_chunks(SPOTIFY_PATH, chunksize)],
+                                     ignore_index=True)
+            else:
+                df_spotify = pd.read_csv(SPOTIFY_PATH, dtype=SPOTIFY_DTYPES)
+                print(df_spotify.head())
+                memory_report(df_spotify, "extract_spotify")
+                snapshot = spotify_snapshot(df_spotify)
+            write_artifact(snapshot, "state/spotify_snapshot", run_id)
+            stage["rows_out"] = len(snapshot)
+
+        affected = None
+        affected_ids = None
+        if mode == "incremental":
+            with metrics.stage("affected_ids", rows_in=len(snapshot)) as stage:
+                affected_ids = affected_track_ids(read_state("spotify_snapshot"), snapshot)
+                affected = write_artifact(affected_ids.to_frame(), "spotify_affected", run_id)
+                stage["rows_out"] = len(affected_ids)
+            print(f"Incremental: {len(affected_ids)} affected track ids")
+
+        def keep_affected(frame):
+            return frame if affected_ids is None else frame[frame["track_id"].astype(str).isin(affected_ids)]
+
+        # only the path and schema go through XCom, the data stays on disk
+        with metrics.stage("write_raw", rows_in=len(snapshot)) as stage:
+            if streaming:
+                chunks = (keep_affected(chunk) for chunk in read_spotify_chunks(SPOTIFY_PATH, chunksize))
+                rows = write_artifact_chunks(chunks, "spotify_raw", run_id)
+            else:
+                rows = write_artifact(keep_affected(df_spotify), "spotify_raw", run_id)
+            stage["rows_out"] = rows["rows"]
+        print(f"{rows['rows']} Spotify rows to transform")
+        return {"mode": mode, "streaming": streaming, "chunksize": chunksize, "rows": rows, "affected": affected}
 
     @task()
-    def extract_grammy_db():
+    def extract_grammy_db(run_id=None, params=None, ti=None):
+        from airflow.providers.mysql.hooks.mysql import MySqlHook
+        from etl.artifacts import write_artifact_chunks, read_artifact
+        from etl.incremental import resolve_mode, load_watermark, stage_watermark, utc_watermark
+        from etl.metrics import task_metrics
+        from etl.streaming import GRAMMY_KEY_COLUMNS, grammy_query, read_grammy_batches
+
+        metrics = task_metrics("extract_grammy_db", ti, params, run_id)
+        mode = resolve_mode(params)
         mysql_hook = MySqlHook(mysql_conn_id='mysql_local')
-        sql = "SELECT * FROM grammy_awards;"
-        df_grammy = mysql_hook.get_pandas_df(sql)
-        print(df_grammy.head())
-        return df_grammy.to_json(orient='records')
+        params = params or {}
+
+        # only the used columns, optionally a year range, and in incremental mode only rows
+        # updated since the last committed watermark (compared in UTC)
+        watermark = load_watermark().get("grammy_updated_at") if mode == "incremental" else None
+        if watermark is not None:
+            watermark = utc_watermark([watermark])
+        engine = mysql_hook.get_sqlalchemy_engine()
+        sql, query_params = grammy_query(year_from=params.get("grammy_year_from"),
+                                         year_to=params.get("grammy_year_to"), updated_after=watermark,
+                                         dialect=engine.dialect.name)
+        print(f"Grammy query: {sql} {query_params}")
+
+        # batches go from the server-side cursor straight into the typed staging file
+        stats = {}
+        with metrics.stage("query") as stage:
+            batch_size = int(params.get("grammy_batch_size") or GRAMMY_BATCH_SIZE)
+            batches = read_grammy_batches(engine, sql, query_params, batch_size=batch_size, stats=stats)
+            rows = write_artifact_chunks(batches, "grammy_raw", run_id)
+            stage.update(rows_out=rows["rows"], batches=stats["batches"], bytes=stats["bytes"],
+                         file_bytes=os.path.getsize(rows["path"]))
+        print(f"Grammy extract: {stats['rows']} rows in {stats['batches']} batches, "
+              f"{stats['bytes'] / 1024 ** 2:.1f} MB decoded, {os.path.getsize(rows['path']) / 1024 ** 2:.1f} MB staged")
+        if mode == "incremental":
+            print(f"Incremental: {rows['rows']} grammy rows updated since {watermark} UTC")
+
+        # incremental runs also read the key columns of every row in range, so state rows whose
+        # key changed or that were deleted in the source can be dropped
+        keys = None
+        if mode == "incremental":
+            with metrics.stage("query_keys") as stage:
+                key_sql, key_params = grammy_query(GRAMMY_KEY_COLUMNS, year_from=params.get("grammy_year_from"),
+                                                   year_to=params.get("grammy_year_to"))
+                keys = write_artifact_chunks(read_grammy_batches(engine, key_sql, key_params, batch_size=batch_size),
+                                             "grammy_keys", run_id)
+                stage["rows_out"] = keys["rows"]
+            print(f"Grammy keys: {keys['rows']} rows in the source")
+        engine.dispose()
+
+        if rows["rows"]:
+            watermark = utc_watermark(read_artifact(rows, columns=["updated_at"])["updated_at"])
+        stage_watermark({"grammy_updated_at": watermark}, run_id)
+        return {"mode": mode, "rows": rows, "keys": keys}
+
+    @task()
+    def clean_spotify_source(spotify_meta, run_id=None, params=None, ti=None):
+        import pandas as pd
+        from etl.artifacts import run_dir, write_artifact, read_artifact, iter_artifact, empty_artifact
+        from etl.engines import clean_spotify_engine
+        from etl.incremental import read_state, merge_spotify
+        from etl.metrics import task_metrics
+        from etl.schema import memory_report
+        from etl.streaming import clean_spotify_streaming
+        from etl.transform import clean_spotify
+
+        metrics = task_metrics("clean_spotify_source", ti, params, run_id)
+        mode = spotify_meta["mode"]
+        engine = (params or {}).get("engine") or "pandas"
+        print(f"Mode: {mode}, engine: {engine}")
+        print(f"Spotify artifact: {spotify_meta['rows']['rows']} rows from {spotify_meta['rows']['path']}")
+
+        # clean only what came in, then fold it into the last committed state
+        with metrics.stage("clean_spotify", rows_in=spotify_meta["rows"]["rows"]) as stage:
+            if engine != "pandas":
+                # out-of-core engine straight over the artifact, spilling under the run dir
+                df = clean_spotify_engine(spotify_meta["rows"]["path"], engine, spill_dir=run_dir(run_id),
+                                          memory_limit=params.get("engine_memory_limit") or None)
+            elif spotify_meta["streaming"]:
+                # row steps per chunk, dedup one hash partition at a time, spilled under the run dir
+                # an incremental run without changed rows has a 0-row artifact and yields no chunk
+                chunks = iter_artifact(spotify_meta["rows"], batch_size=spotify_meta["chunksize"])
+                df = clean_spotify_streaming(chunks, spill_dir=run_dir(run_id),
+                                             template=empty_artifact(spotify_meta["rows"]))
+            else:
+                df = clean_spotify(read_artifact(spotify_meta["rows"]))
+            stage["engine"] = engine
+            stage["rows_out"] = len(df)
+        memory_report(df, "clean_spotify")
+
+        with metrics.stage("merge_state", rows_in=len(df)) as stage:
+            if mode == "incremental":
+                affected_ids = read_artifact(spotify_meta["affected"])["track_id"]
+                sp_current, changed_ids = merge_spotify(read_state("spotify_clean"), df, affected_ids)
+            else:
+                sp_current, changed_ids = df, df["track_id"].unique()
+            current = write_artifact(sp_current, "state/spotify_clean", run_id)
+            changed = write_artifact(pd.DataFrame({"track_id": changed_ids}), "spotify_changed", run_id)
+            stage["rows_out"] = len(sp_current)
+        return {"mode": mode, "current": current, "changed": changed}
 
     @task()
-    def transform_and_merge(spotify_json, grammy_json):
-        df = pd.DataFrame(json.loads(spotify_json))
-        df1 = pd.DataFrame(json.loads(grammy_json))
-
-        # load spotify csv
-        df = pd.read_csv("data/spotify_dataset.csv")
-
-        # drop helper index column if present
-        if "Unnamed: 0" in df.columns:
-            df = df.drop(columns=["Unnamed: 0"])
-
-        # drop unwanted columns (ignore if missing)
-        cols_to_drop = ["key", "mode", "time_signature", "winner"]
-        df = df.drop(columns=[c for c in cols_to_drop if c in df.columns], errors="ignore")
-
-        # drop rows with any nulls
-        df = df.dropna().drop_duplicates(keep="first")
-        print("Spotify shape after initial cleaning:", df.shape)
-
-        # normalize synonyms in track_genre
-        normalize_mapping = {"latino": "latin", "kids": "children"}
-        df["track_genre"] = df["track_genre"].replace(normalize_mapping)
-
-        # map sub-genres to main buckets
-        genre_mapping = {
-            # rock
-            "alt-rock": "rock", "hard-rock": "rock", "punk-rock": "rock",
-            "rock-n-roll": "rock", "rockabilly": "rock", "grunge": "rock",
-            "psych-rock": "rock", "punk": "rock", "rock": "rock",
-            # metal
-            "metal": "metal", "black-metal": "metal", "death-metal": "metal",
-            "heavy-metal": "metal", "metalcore": "metal", "grindcore": "metal",
-            # pop
-            "pop": "pop", "indie-pop": "pop", "power-pop": "pop",
-            "synth-pop": "pop", "pop-film": "pop", "k-pop": "pop",
-            "j-pop": "pop", "mandopop": "pop", "cantopop": "pop",
-            # electronic
-            "edm": "electronic", "electro": "electronic", "electronic": "electronic",
-            "deep-house": "electronic", "detroit-techno": "electronic", "techno": "electronic",
-            "house": "electronic", "progressive-house": "electronic", "chicago-house": "electronic",
-            "trance": "electronic", "dubstep": "electronic", "drum-and-bass": "electronic",
-            "idm": "electronic", "trip-hop": "electronic", "minimal-techno": "electronic",
-            "club": "electronic", "dance": "electronic", "dancehall": "electronic",
-            "disco": "electronic", "dub": "electronic", "garage": "electronic",
-            "breakbeat": "electronic",
-            # hip hop / r&b
-            "hip-hop": "hip-hop", "r-n-b": "hip-hop",
-            # jazz / blues
-            "jazz": "jazz", "blues": "blues", "bluegrass": "blues",
-            # latin
-            "latin": "latin", "salsa": "latin", "samba": "latin", "pagode": "latin",
-            "sertanejo": "latin", "brazil": "latin", "forro": "latin", "mpb": "latin",
-            # other mains
-            "country": "country", "folk": "folk", "gospel": "gospel",
-            "opera": "classical", "classical": "classical", "piano": "classical",
-            "acoustic": "acoustic", "singer-songwriter": "acoustic", "songwriter": "acoustic",
-            # j-music
-            "anime": "j-music", "j-rock": "j-music", "j-idol": "j-music", "j-dance": "j-music",
-            # misc
-            "alternative": "alternative", "ambient": "ambient", "world-music": "world",
-            "afrobeat": "world", "indian": "world", "iranian": "world", "turkish": "world",
-            "swedish": "world", "french": "world", "german": "world", "spanish": "world",
-            "malay": "world", "emo": "emo", "hardcore": "hardcore", "hardstyle": "hardstyle",
-            "industrial": "industrial", "goth": "goth", "groove": "groove",
-            "funk": "funk", "soul": "soul", "comedy": "comedy", "children": "children",
-            "disney": "children", "study": "study", "sleep": "study", "happy": "mood",
-            "sad": "mood", "romance": "mood", "party": "mood", "show-tunes": "theatre",
-            "new-age": "new-age", "chill": "chill", "guitar": "instrumental",
+    def clean_grammy_source(grammy_meta, run_id=None, params=None, ti=None):
+        from etl.artifacts import write_artifact, read_artifact
+        from etl.incremental import read_state, merge_grammy
+        from etl.metrics import task_metrics
+        from etl.schema import GRAMMY_DTYPES, apply_schema, memory_report
+        from etl.stages import clean_grammy_keyed
+
+        metrics = task_metrics("clean_grammy_source", ti, params, run_id)
+        mode = grammy_meta["mode"]
+        print(f"Grammy artifact: {grammy_meta['rows']['rows']} rows from {grammy_meta['rows']['path']}")
+
+        with metrics.stage("clean_grammy", rows_in=grammy_meta["rows"]["rows"]) as stage:
+            df1 = clean_grammy_keyed(apply_schema(read_artifact(grammy_meta["rows"]), GRAMMY_DTYPES))
+            stage["rows_out"] = len(df1)
+        memory_report(df1, "clean_grammy")
+
+        with metrics.stage("merge_state", rows_in=len(df1)) as stage:
+            if mode == "incremental":
+                source_uks = None
+                if grammy_meta.get("keys"):
+                    source_uks = clean_grammy_keyed(apply_schema(read_artifact(grammy_meta["keys"]),
+                                                                 GRAMMY_DTYPES))["grammy_uk"]
+                old_clean = read_state("grammy_clean")
+                # state and delta categories differ, concat falls back to object
+                gr_current = apply_schema(merge_grammy(old_clean, df1, source_uks), GRAMMY_DTYPES)
+                if source_uks is not None:
+                    gone = int((~old_clean["grammy_uk"].isin(source_uks)).sum())
+                    stage["gone"] = gone
+                    print(f"Grammy state: {gone} rows whose key is gone from the source dropped")
+            else:
+                gr_current = df1.drop_duplicates(subset="grammy_uk").reset_index(drop=True)
+            current = write_artifact(gr_current, "state/grammy_clean", run_id)
+            delta = write_artifact(df1[["grammy_uk"]], "grammy_delta_keys", run_id)
+            stage["rows_out"] = len(gr_current)
+        return {"mode": mode, "current": current, "delta": delta}
+
+    @task(multiple_outputs=True)
+    def plan_matching(spotify_clean, grammy_clean, run_id=None, params=None, ti=None):
+        from etl.artifacts import write_artifact, read_artifact
+        from etl.metrics import task_metrics
+        from etl.normalize import ArtistCache
+        from etl.stages import normalize_sources, split_shards
+
+        metrics = task_metrics("plan_matching", ti, params, run_id)
+        sp_current = read_artifact(spotify_clean["current"])
+        gr_current = read_artifact(grammy_clean["current"])
+
+        # build artist lists and flags, once per distinct artist string
+        artist_cache = ArtistCache().load()
+        with metrics.stage("normalize", rows_in=len(sp_current) + len(gr_current)) as stage:
+            sp, gr = normalize_sources(sp_current, gr_current, artist_cache)
+            stage["rows_out"] = len(sp) + len(gr)
+        artist_cache.save()
+        print(f"Artist cache: {artist_cache.hits} hits, {artist_cache.misses} misses")
+
+        # one mapped match_shard task per spotify shard, each against the whole grammy side
+        count = max(1, int((params or {}).get("match_shards") or MATCH_SHARDS))
+        with metrics.stage("split", rows_in=len(sp)) as stage:
+            shards = [
+                {"index": i, "spotify": write_artifact(part, f"match/spotify_{i:03d}", run_id)}
+                for i, part in enumerate(split_shards(sp, count))
+            ]
+            spotify = write_artifact(sp, "match/spotify", run_id)
+            grammy = write_artifact(gr, "match/grammy", run_id)
+            stage["rows_out"] = sum(shard["spotify"]["rows"] for shard in shards)
+        print(f"{count} matching shards: {[shard['spotify']['rows'] for shard in shards]} spotify rows")
+
+        return {
+            "mode": spotify_clean["mode"],
+            "spotify": spotify,
+            "grammy": grammy,
+            "changed": spotify_clean["changed"],
+            "grammy_delta": grammy_clean["delta"],
+            "shards": shards,
         }
 
-        # create sub_genre and main_genre
-        df["sub_genre"] = df["track_genre"]
-        df["main_genre"] = df["track_genre"].map(genre_mapping).fillna(df["track_genre"])
-        df = df.drop(columns=["track_genre"])
-
-        # resolve duplicates by track_id
-        def resolve_duplicates(group):
-            main_row = group.loc[group["popularity"].idxmax()].copy()
-            main_genre = main_row["main_genre"]
-            subgenres = set(group["sub_genre"].dropna().unique())
-            subgenres = {g for g in subgenres if g != main_genre}
-            main_row["sub_genre"] = ", ".join(sorted(subgenres)) if subgenres else None
-            return main_row
-
-        df = df.groupby("track_id", group_keys=False, dropna=False).apply(resolve_duplicates).reset_index(drop=True)
-
-        # duration in minutes
-        df["duration_ms"] = df["duration_ms"] / 60000
-        df = df.rename(columns={"duration_ms": "duration_min"})
-
-        # clip positive loudness to 0
-        df.loc[df["loudness"] > 0, "loudness"] = 0
-
-        # normalize text columns
-        for col in ["artists", "album_name", "track_name"]:
-            df[col] = df[col].str.lower().str.strip()
-
-        # consolidate by track_name + artists
-        def consolidate_simple(group):
-            main_row = group.loc[group["popularity"].idxmax()].copy()
-            other_albums = group.loc[group["album_name"] != main_row["album_name"], "album_name"].unique().tolist()
-            main_row["album_others"] = "; ".join(other_albums) if other_albums else None
-            return main_row
-
-        df = df.groupby(["track_name", "artists"], group_keys=False).apply(consolidate_simple).reset_index(drop=True)
-
-        # load grammys csv
-        df1 = pd.read_csv("data/the_grammy_awards.csv")
-
-        # drop unused columns
-        df1 = df1.drop(columns=["winner", "workers", "img", "published_at", "updated_at"], errors="ignore")
-
-        # normalize text
-        grammy_clean_cols = ["title", "category", "nominee", "artist"]
-        for col in grammy_clean_cols:
-            df1[col] = df1[col].astype(str).str.lower().str.strip()
-
-        # fill empty nominee/artist
-        for col in ["nominee", "artist"]:
-            df1[col] = df1[col].replace("nan", "").replace("", "not specified").fillna("not specified")
-
-        # helpers
-        def normalize_artists(artist_str):
-            if pd.isna(artist_str) or str(artist_str).strip() == "":
-                return []
-            s = unicodedata.normalize("NFKD", str(artist_str)).encode("ascii", "ignore").decode("utf-8").lower()
-            s = re.sub(r"\s*(feat\.?|featuring|with|and|,|&|;)\s*", ";", s)
-            return [a.strip() for a in s.split(";") if a.strip()]
-
-        def is_various_artists(artist_str):
-            if pd.isna(artist_str) or str(artist_str).strip() == "":
-                return False
-            s = unicodedata.normalize("NFKD", str(artist_str)).encode("ascii", "ignore").decode("utf-8").lower().strip()
-            s = re.sub(r"\s+", " ", s)
-            aliases = {"various artists", "varios artistas", "v.a.", "v.a", "varios", "various", "artistas varios", "compilation", "compilacion"}
-            return s in aliases or bool(re.search(r"\b(various|varios)\s+artists?\b", s))
-
-        def fuzzy_title_match(t1, t2, threshold=90):
-            if not isinstance(t1, str) or not isinstance(t2, str):
-                return False
-            return fuzz.token_set_ratio(t1, t2) >= threshold
-
-        def fuzzy_artist_match(list1, list2, threshold=90):
-            if not list1 or not list2:
-                return False
-            for a1 in list1:
-                for a2 in list2:
-                    if fuzz.token_set_ratio(a1, a2) >= threshold:
-                        return True
-            return False
-
-        # build artist lists and flags
-        df["artist_list_spotify"] = df["artists"].apply(normalize_artists)
-        df1["artist_list_grammy"] = df1["artist"].apply(normalize_artists)
-        df1["is_various_artists"] = df1["artist"].apply(is_various_artists)
-
-        # merge
-        merged_full = pd.merge(
-            df,
-            df1,
-            left_on="track_name",
-            right_on="nominee",
-            how="outer",
-            suffixes=("_spotify", "_grammy")
-        )
-
-        # fuzzy match
-        def row_is_match(row, title_thr=90, artist_thr=90):
-            t_sp = row.get("track_name")
-            t_gr = row.get("nominee")
-            if not (isinstance(t_sp, str) and isinstance(t_gr, str)):
-                return False
-            title_ok = fuzzy_title_match(t_sp, t_gr, threshold=title_thr)
-            if not title_ok:
-                return False
-            if bool(row.get("is_various_artists")):
-                artists_sp = row.get("artist_list_spotify", []) or []
-                return len(artists_sp) > 1
-            artists_sp = row.get("artist_list_spotify", []) or []
-            artists_gr = row.get("artist_list_grammy", []) or []
-            return fuzzy_artist_match(artists_sp, artists_gr, threshold=artist_thr)
-
-        merged_full["grammy_nominee"] = merged_full.apply(row_is_match, axis=1)
-
-        # handle nans and types
-        if "explicit" in merged_full.columns:
-            merged_full["explicit"] = merged_full["explicit"].astype("boolean").fillna(False)
-        else:
-            merged_full["explicit"] = False
-
-        obj_cols = [c for c in merged_full.select_dtypes(include=["object"]).columns if c != "explicit"]
-        merged_full[obj_cols] = merged_full[obj_cols].fillna("not specified")
-
-        num_cols = merged_full.select_dtypes(include=[np.number]).columns.tolist()
-        merged_full[num_cols] = merged_full[num_cols].fillna(0)
-
-        # rename and drop helper cols
-        merged_full["artist_spotify"] = merged_full.get("artists", None)
-        merged_full["artist_grammy"] = merged_full.get("artist", None)
-
-        merged_full = merged_full.drop(
-            columns=["artists", "artist", "artist_list_spotify", "artist_list_grammy", "is_various_artists"],
-            errors="ignore"
-        )
-
-        # reorder columns
-        cols_spotify = [
-            "track_id", "track_name", "artist_spotify", "album_name", "album_others",
-            "popularity", "duration_min", "explicit", "danceability", "energy", "loudness",
-            "speechiness", "acousticness", "instrumentalness", "liveness", "valence", "tempo",
-            "main_genre", "sub_genre"
-        ]
-        cols_grammy = ["year", "title", "category", "nominee", "artist_grammy", "grammy_nominee"]
-        cols_spotify = [c for c in cols_spotify if c in merged_full.columns]
-        cols_grammy = [c for c in cols_grammy if c in merged_full.columns]
-        cols_rest = [c for c in merged_full.columns if c not in cols_spotify + cols_grammy]
-        merged_full = merged_full[cols_spotify + cols_grammy + cols_rest]
+    @task()
+    def match_shard(shard, plan, run_id=None, params=None, ti=None):
+        from etl.artifacts import write_artifact, read_artifact
+        from etl.incremental import read_state
+        from etl.matching import MatchCache
+        from etl.metrics import task_metrics
+        from etl.stages import match_sources
+
+        metrics = task_metrics(f"match_shard.{shard['index']}", ti, params, run_id)
+        sp = read_artifact(shard["spotify"])
+        gr = read_artifact(plan["grammy"])
+
+        # decisions of earlier runs are reused unless the match_cache param is off
+        match_cache = MatchCache().open() if (params or {}).get("match_cache", True) else None
+
+        # blocked fuzzy matching, only for changed rows when incremental
+        with metrics.stage("matching", rows_in=len(sp) + len(gr)) as stage:
+            if plan["mode"] == "incremental":
+                pairs = match_sources(sp, gr, read_state("pairs"), read_artifact(plan["changed"])["track_id"],
+                                      read_artifact(plan["grammy_delta"])["grammy_uk"], cache=match_cache)
+            else:
+                pairs = match_sources(sp, gr, cache=match_cache)
+            stage["rows_out"] = len(pairs)
+            if match_cache is not None:
+                stage["cache"] = match_cache.report()
+
+        if match_cache is not None:
+            match_cache.close()
+            print(f"Match cache: {match_cache.report()}")
+        return write_artifact(pairs, f"match/pairs_{shard['index']:03d}", run_id)
+
+    @task(multiple_outputs=True)
+    def merge_and_export(plan, shard_pairs, run_id=None, params=None, ti=None):
+        import pandas as pd
+        from etl.artifacts import write_artifact, read_artifact
+        from etl.incremental import read_state
+        from etl.metrics import task_metrics
+        from etl.schema import memory_report
+        from etl.stages import merge_sources, fact_delta
+
+        metrics = task_metrics("merge_and_export", ti, params, run_id)
+        mode = plan["mode"]
+        pairs = pd.concat([read_artifact(meta) for meta in shard_pairs], ignore_index=True)
+        write_artifact(pairs, "state/pairs", run_id)
+
+        # outer-style join of the matched pairs
+        sp = read_artifact(plan["spotify"])
+        gr = read_artifact(plan["grammy"])
+        merged_full = metrics.timed("merge")(merge_sources)(sp, gr, pairs)
 
         # safe print and return
         matched_rows = int(merged_full["grammy_nominee"].sum()) if "grammy_nominee" in merged_full.columns else 0
         print("Final merged shape:", merged_full.shape)
+        memory_report(merged_full, "merged")
         print("Matched rows (grammy_nominee == True):", matched_rows)
 
-        os.makedirs(os.path.dirname(OUT_PATH), exist_ok=True)
-
-        for c in merged_full.select_dtypes(include=["boolean", "bool"]).columns:
-            merged_full[c] = merged_full[c].astype(bool)
-
-        merged_full.to_csv(OUT_PATH, index=False, encoding="utf-8-sig")
-        print(f"CSV saved in: {OUT_PATH}")
-        return OUT_PATH  
+        # only rows that differ from what the warehouse already holds are loaded
+        with metrics.stage("fact_delta", rows_in=len(merged_full)) as stage:
+            old_hashes = read_state("fact_hashes")["row_hash"] if mode == "incremental" else None
+            merged_full, inserted, deleted = fact_delta(merged_full, old_hashes)
+            write_artifact(merged_full[["row_hash"]], "state/fact_hashes", run_id)
+            deleted_meta = write_artifact(deleted, "fact_deleted", run_id)
+            stage["rows_out"] = len(inserted) + len(deleted)
+        print(f"Fact delta: {len(inserted)} rows to insert, {len(deleted)} rows to delete")
+
+        # typed arrow files with the schema embedded, memory mapped by load_star_schema and
+        # load_to_drive; a full run inserts every row, so the merged file is the delta too
+        with metrics.stage("arrow_write", rows_in=len(merged_full)) as stage:
+            merged_meta = write_artifact(merged_full, "merged", run_id, fmt="arrow")
+            inserted_meta = merged_meta if mode == "full" else write_artifact(inserted, "fact_inserted", run_id,
+                                                                              fmt="arrow")
+            stage["rows_out"] = len(merged_full)
+        print(f"Merged artifact saved in: {merged_meta['path']}")
+
+        return {
+            "merged": merged_meta,
+            "mode": mode,
+            "inserted": inserted_meta,
+            "deleted": deleted_meta,
+        }
 
     @task()
-    def load_to_drive(file_path: str):
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"No existe el archivo: {file_path}")
-
-        creds = Credentials.from_authorized_user_file(TOKEN_PATH)
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-
-        service = build('drive', 'v3', credentials=creds)
-
-        metadata = {"name": os.path.basename(file_path), "mimeType": "text/csv"}
-        if FOLDER_ID and FOLDER_ID != "TU_FOLDER_ID_AQUI":
-            metadata["parents"] = [FOLDER_ID]
+    def load_to_drive(merged_meta: dict, run_id=None, params=None, ti=None):
+        from google.auth.transport.requests import Request
+        from google.oauth2.credentials import Credentials
+        from etl.artifacts import open_artifact
+        from etl.drive import DRIVE_ENDPOINT, drive_service, export_merged, upload_file
+        from etl.metrics import task_metrics
+
+        metrics = task_metrics("load_to_drive", ti, params, run_id)
+        if not params.get("drive_export", True):
+            print("Drive export disabled, nothing written or uploaded")
+            return None
+
+        # csv (and its gzip) or parquet written from the typed artifact; unchanged data encodes
+        # to the same bytes
+        with metrics.stage("export", rows_in=merged_meta["rows"]) as stage:
+            merged = open_artifact(merged_meta)
+            merged = merged.select([col for col in merged.column_names if col != "row_hash"])
+            upload_path, mimetype = export_merged(merged, OUT_PATH, params.get("drive_format") or "csv")
+            stage["bytes"] = os.path.getsize(upload_path)
+            stage["rows_out"] = merged.num_rows
+        print(f"Export saved in: {upload_path} ({stage['bytes']} bytes)")
+
+        if DRIVE_ENDPOINT:
+            service = drive_service(endpoint=DRIVE_ENDPOINT)
+        else:
+            creds = Credentials.from_authorized_user_file(TOKEN_PATH)
+            if creds and creds.expired and creds.refresh_token:
+                creds.refresh(Request())
+            service = drive_service(creds)
 
-        media = MediaFileUpload(file_path, mimetype="text/csv", resumable=True)
+        folder_id = FOLDER_ID if FOLDER_ID and FOLDER_ID != "TU_FOLDER_ID_AQUI" else None
 
-        uploaded = service.files().create(
-            body=metadata, media_body=media, fields="id, name, parents"
-        ).execute()
+        # skipped when drive's md5 of the last upload matches, otherwise that file is updated in place
+        with metrics.stage("upload") as stage:
+            uploaded = upload_file(service, upload_path, mimetype, folder_id=folder_id,
+                                   chunksize=int(params.get("drive_chunksize") or DRIVE_CHUNK_SIZE),
+                                   retries=int(params.get("drive_retries") or 0))
+            stage.update({key: uploaded[key] for key in ("action", "bytes", "chunks", "retries")})
 
-        print(f"File uploaded to Drive: {uploaded.get('name')} (ID: {uploaded.get('id')})")
-        return uploaded.get("id")
+        print(f"File {uploaded['action']} in Drive: {uploaded['name']} (ID: {uploaded['id']})")
+        return uploaded["id"]
 
 
     @task()
-    def load_star_schema(file_path: str,
+    def load_star_schema(load_meta: dict,
                         schema_name: str = "full_dw",
-                        recreate_schema: bool = True):
-
-        # Read CSV 
-        df = pd.read_csv(file_path)
-
-        # Normalizes booleans if they come as text
-        if "explicit" in df.columns:
-            df["explicit"] = (
-                df["explicit"].astype(str).str.strip().str.lower()
-                .map({"true": True, "1": True, "false": False, "0": False})
-                .fillna(False)
-            )
-        if "grammy_nominee" in df.columns:
-            df["grammy_nominee"] = (
-                df["grammy_nominee"].astype(str).str.strip().str.lower()
-                .map({"true": True, "1": True, "false": False, "0": False})
-                .fillna(False)
-            )
-
-        # MySQL connection
+                        bulk_method: str = "auto",
+                        run_id=None, params=None, ti=None):
+        from airflow.providers.mysql.hooks.mysql import MySqlHook
+        from etl.aggregates import aggregate_ddl
+        from etl.artifacts import read_artifact, open_artifact
+        from etl.metrics import task_metrics
+        from etl.partitions import existing_partitions
+        from etl.stages import load_star
+        from etl.star import star_ddl
+
+        metrics = task_metrics("load_star_schema", ti, params, run_id)
+
+        # full runs reload the changed year partitions of the fact, incremental runs patch it
+        # with the fact delta
+        full = load_meta["mode"] == "full"
+        # memory mapped: each dimension and the fact only convert the columns they are built from
+        with metrics.stage("read_delta") as stage:
+            df = open_artifact(load_meta["inserted"])
+            deleted = read_artifact(load_meta["deleted"])["row_hash"]
+            stage["rows_out"] = df.num_rows + len(deleted)
+        print(f"Fact delta: {df.num_rows} rows from {load_meta['inserted']['path']}")
+
+        # MySQL connection, the pool holds a connection per parallel fact writer
+        workers = max(1, int((params or {}).get("load_workers") or 1))
         hook = MySqlHook(mysql_conn_id="mysql_dw")
-        engine = hook.get_sqlalchemy_engine()
-
-        # DDL
-        ddl = []
-        if recreate_schema:
-            ddl.append(f"DROP DATABASE IF EXISTS {schema_name}")
-        ddl.append(f"CREATE DATABASE IF NOT EXISTS {schema_name}")
-
-        ddl += [
-            
-            f"""
-            CREATE TABLE IF NOT EXISTS {schema_name}.dim_track (
-                track_key INT AUTO_INCREMENT PRIMARY KEY,
-                track_spotify_id VARCHAR(64) NOT NULL UNIQUE,
-                track_name TEXT NOT NULL
-            ) ENGINE=InnoDB
-            DEFAULT CHARSET=utf8mb4
-            COLLATE=utf8mb4_unicode_ci;
-            """,
-
-            f"""
-            CREATE TABLE IF NOT EXISTS {schema_name}.dim_artist (
-                artist_key INT AUTO_INCREMENT PRIMARY KEY,
-                artist_spotify TEXT NOT NULL,
-                INDEX idx_artist_name (artist_spotify(191))
-            ) ENGINE=InnoDB
-            DEFAULT CHARSET=utf8mb4
-            COLLATE=utf8mb4_unicode_ci;
-            """,
-
-            f"""
-            CREATE TABLE IF NOT EXISTS {schema_name}.dim_album (
-                album_key INT AUTO_INCREMENT PRIMARY KEY,
-                album_name   TEXT NOT NULL,
-                album_others TEXT NOT NULL,
-                INDEX idx_album (album_name(191), album_others(191))
-            ) ENGINE=InnoDB
-            DEFAULT CHARSET=utf8mb4
-            COLLATE=utf8mb4_unicode_ci
-            """,
-            f"""
-            CREATE TABLE IF NOT EXISTS {schema_name}.dim_genre (
-                genre_key INT AUTO_INCREMENT PRIMARY KEY,
-                main_genre VARCHAR(100) NOT NULL,
-                sub_genre  VARCHAR(100) NOT NULL,
-                UNIQUE(main_genre, sub_genre)
-            ) ENGINE=InnoDB;
-            """,
-            f"""
-            CREATE TABLE IF NOT EXISTS {schema_name}.dim_time (
-                time_key INT AUTO_INCREMENT PRIMARY KEY,
-                year SMALLINT NOT NULL UNIQUE
-            ) ENGINE=InnoDB;
-            """,
-
-            f"""
-            CREATE TABLE IF NOT EXISTS {schema_name}.dim_grammy (
-                grammy_key INT AUTO_INCREMENT PRIMARY KEY,
-                title         VARCHAR(191) NOT NULL,
-                category      VARCHAR(128) NOT NULL,
-                nominee       VARCHAR(191) NOT NULL,
-                artist_grammy TEXT NOT NULL,
-                grammy_uk CHAR(64)
-                AS (SHA2(CONCAT_WS('|', title, category, nominee, artist_grammy), 256)) STORED,
-                UNIQUE KEY uq_dim_grammy (grammy_uk)
-            ) ENGINE=InnoDB
-            DEFAULT CHARSET=utf8mb4
-            COLLATE=utf8mb4_unicode_ci;
-            """,
-            f"""
-            CREATE TABLE IF NOT EXISTS {schema_name}.fact_track_metrics (
-                fact_id BIGINT AUTO_INCREMENT PRIMARY KEY,
-                track_key  INT NOT NULL,
-                artist_key INT NOT NULL,
-                album_key  INT NOT NULL,
-                genre_key  INT NOT NULL,
-                time_key   INT NOT NULL,
-                grammy_key INT NOT NULL,
-                popularity       DOUBLE NOT NULL,
-                duration_min     DOUBLE NOT NULL,
-                explicit         TINYINT(1) NOT NULL,
-                danceability     DOUBLE NOT NULL,
-                energy           DOUBLE NOT NULL,
-                loudness         DOUBLE NOT NULL,
-                speechiness      DOUBLE NOT NULL,
-                acousticness     DOUBLE NOT NULL,
-                instrumentalness DOUBLE NOT NULL,
-                liveness         DOUBLE NOT NULL,
-                valence          DOUBLE NOT NULL,
-                tempo            DOUBLE NOT NULL,
-                grammy_nominee   TINYINT(1) NOT NULL,
-                CONSTRAINT fk_track  FOREIGN KEY (track_key)  REFERENCES {schema_name}.dim_track(track_key),
-                CONSTRAINT fk_artist FOREIGN KEY (artist_key) REFERENCES {schema_name}.dim_artist(artist_key),
-                CONSTRAINT fk_album  FOREIGN KEY (album_key)  REFERENCES {schema_name}.dim_album(album_key),
-                CONSTRAINT fk_genre  FOREIGN KEY (genre_key)  REFERENCES {schema_name}.dim_genre(genre_key),
-                CONSTRAINT fk_time   FOREIGN KEY (time_key)   REFERENCES {schema_name}.dim_time(time_key),
-                CONSTRAINT fk_grammy FOREIGN KEY (grammy_key) REFERENCES {schema_name}.dim_grammy(grammy_key)
-            ) ENGINE=InnoDB;
-            """,
-        ]
-
-        with engine.begin() as conn:
-            for stmt in ddl:
-                conn.execute(text(stmt))
-
-        # NOT NULL
-        for col in ["album_name","album_others","title","category","nominee",
-                    "artist_grammy","artist_spotify","track_name","main_genre","sub_genre"]:
-            if col in df.columns:
-                df[col] = df[col].fillna("")
-        if "year" in df.columns:
-            df["year"] = df["year"].fillna(0).astype("int16")
-
-        # Dimensions
-        dim_track = df[["track_id","track_name"]].drop_duplicates().rename(columns={"track_id":"track_spotify_id"})
-        dim_artist = df[["artist_spotify"]].drop_duplicates()
-        dim_album  = df[["album_name","album_others"]].drop_duplicates()
-        dim_genre  = df[["main_genre","sub_genre"]].drop_duplicates()
-        dim_time   = df[["year"]].drop_duplicates().astype({"year":"int16"})
-        dim_grammy = df[["title","category","nominee","artist_grammy"]].drop_duplicates()
-
-        dim_track.to_sql("dim_track", engine, schema=schema_name, if_exists="append", index=False)
-        dim_artist.to_sql("dim_artist", engine, schema=schema_name, if_exists="append", index=False)
-        dim_album.to_sql("dim_album", engine, schema=schema_name, if_exists="append", index=False)
-        dim_genre.to_sql("dim_genre", engine, schema=schema_name, if_exists="append", index=False)
-        dim_time.to_sql("dim_time", engine, schema=schema_name, if_exists="append", index=False)
-        dim_grammy.to_sql("dim_grammy", engine, schema=schema_name, if_exists="append", index=False)
-
-        # Keys
-        with engine.connect() as conn:
-            t  = pd.read_sql(text(f"SELECT track_key, track_spotify_id FROM {schema_name}.dim_track"), conn)
-            a  = pd.read_sql(text(f"SELECT artist_key, artist_spotify FROM {schema_name}.dim_artist"), conn)
-            al = pd.read_sql(text(f"SELECT album_key, album_name, album_others FROM {schema_name}.dim_album"), conn)
-            g  = pd.read_sql(text(f"SELECT genre_key, main_genre, sub_genre FROM {schema_name}.dim_genre"), conn)
-            tm = pd.read_sql(text(f"SELECT time_key, year FROM {schema_name}.dim_time"), conn)
-            gr = pd.read_sql(text(f"SELECT grammy_key, title, category, nominee, artist_grammy FROM {schema_name}.dim_grammy"), conn)
-
-        # Fact
-        fact = (df.copy()
-                .merge(t,  left_on="track_id", right_on="track_spotify_id")
-                .merge(a,  on="artist_spotify")
-                .merge(al, on=["album_name","album_others"])
-                .merge(g,  on=["main_genre","sub_genre"])
-                .merge(tm, on="year")
-                .merge(gr, on=["title","category","nominee","artist_grammy"]))
-
-        if "explicit" in fact.columns:
-            fact["explicit"] = fact["explicit"].astype(int)
-        if "grammy_nominee" in fact.columns:
-            fact["grammy_nominee"] = fact["grammy_nominee"].astype(int)
-
-        fact_cols = [
-            "track_key","artist_key","album_key","genre_key","time_key","grammy_key",
-            "popularity","duration_min","explicit","danceability","energy","loudness",
-            "speechiness","acousticness","instrumentalness","liveness","valence","tempo",
-            "grammy_nominee"
-        ]
-
-        fact[fact_cols].to_sql("fact_track_metrics", engine, schema=schema_name,
-                                if_exists="append", index=False, chunksize=10_000)
-
-        return f"Cargado esquema {schema_name} con {len(fact)} filas en fact_track_metrics."
+        engine = hook.get_sqlalchemy_engine(engine_kwargs={"pool_size": max(5, workers)})
+
+        # the schema is only rebuilt on request, or when the fact table is missing or predates
+        # the year partitions
+        recreate_schema = full and (bool((params or {}).get("recreate_schema"))
+                                    or not existing_partitions(engine, schema_name))
+        print(f"Mode: {load_meta['mode']}, recreate schema: {recreate_schema}, fact writers: {workers}")
+
+        # DDL, dimensions, deletes and fact inserts
+        with metrics.stage("load_star", rows_in=df.num_rows) as stage:
+            load_stats = load_star(engine, df, deleted, schema=schema_name,
+                                   ddl=star_ddl(schema_name, recreate_schema) + aggregate_ddl(schema_name),
+                                   bulk_method=bulk_method, recreate=recreate_schema, replace_partitions=full,
+                                   workers=workers)
+            stage["rows_out"] = sum(stats["rows"] for stats in load_stats)
+            stage["workers"] = workers
+        for stats in load_stats:
+            print(stats)
+
+        return (f"Cargado esquema {schema_name} ({load_meta['mode']}): {df.num_rows} filas insertadas y "
+                f"{len(deleted)} eliminadas en fact_track_metrics.")
+
+    @task()
+    def commit_incremental_state(run_id=None):
+        from etl.incremental import commit_state
+
+        # watermarks and hashes only move forward once the warehouse has the data
+        watermark = commit_state(run_id)
+        print(f"State committed, watermark: {watermark}")
+        return {"watermark": watermark}
+
+    @task(trigger_rule="all_done")
+    def report_run_metrics(run_id=None, params=None, ti=None):
+        from etl.artifacts import prune_runs
+        from etl.metrics import write_run_report
+
+        # runs even when a task failed, with whatever stages were recorded
+        summaries = list(ti.xcom_pull(task_ids=list(INSTRUMENTED_TASKS), key="metrics"))
+        # match_shard is mapped, pulling it by id returns every shard's value
+        summaries += list(ti.xcom_pull(task_ids="match_shard", key="metrics") or [])
+        report = write_run_report(summaries, REPORT_PATH, run_id)
+        for name, totals in report["tasks"].items():
+            print(f"{name}: {totals['wall_s']}s wall, {totals['cpu_s']}s cpu, {totals['peak_mb']} MB peak")
+        print(f"Run report saved in: {REPORT_PATH}")
+
+        # the state is copied out of the run folder on commit, so older run folders are only
+        # kept for inspection; until this run has committed its own folder stays for retries
+        committed = ti.xcom_pull(task_ids=["commit_incremental_state"])[0] is not None
+        deleted = prune_runs(int(params.get("keep_runs", KEEP_RUNS)), run_id, keep_current=not committed)
+        if deleted:
+            print(f"Deleted {len(deleted)} old run folder(s) from staging: {', '.join(deleted)}")
 
     
     # Orchestration
-    spotify_data = extract_spotify_csv()
-    grammy_data  = extract_grammy_db()
-    csv_path     = transform_and_merge(spotify_data, grammy_data)
-    load_to_drive(csv_path)
-    load_star_schema(csv_path)
+    spotify_data  = extract_spotify_csv()
+    grammy_data   = extract_grammy_db()
+    spotify_clean = clean_spotify_source(spotify_data)
+    grammy_clean  = clean_grammy_source(grammy_data)
+    plan          = plan_matching(spotify_clean, grammy_clean)
+    shard_pairs   = match_shard.partial(plan=plan).expand(shard=plan["shards"])
+    merged        = merge_and_export(plan, shard_pairs)
+    uploaded      = load_to_drive(merged["merged"])
+    committed     = load_star_schema(merged) >> commit_incremental_state()
+    [uploaded, committed] >> report_run_metrics()
 
 etl_pipeline()
\ No newline at end of file
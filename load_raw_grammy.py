@@ -1,16 +1,20 @@
-import mysql.connector
+import argparse
 import csv
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
 
-conn = mysql.connector.connect(
-    host="localhost",
-    user="root",
-    password="root",
-    database="grammy_awards"
-)
+import mysql.connector
+
+COLUMNS = ["year", "title", "published_at", "updated_at", "category",
+           "nominee", "artist", "workers", "img", "winner"]
 
-cursor = conn.cursor()
+# natural key of a nomination, reruns update the row instead of inserting it again
+ROW_KEY_SQL = "SHA2(CONCAT_WS('|', year, category, IFNULL(nominee, ''), IFNULL(artist, '')), 256)"
 
-cursor.execute("""
+CREATE_SQL = f"""
 CREATE TABLE IF NOT EXISTS grammy_awards (
     year INT,
     title TEXT,
@@ -21,34 +25,181 @@ CREATE TABLE IF NOT EXISTS grammy_awards (
     artist TEXT,
     workers TEXT,
     img TEXT,
-    winner BOOLEAN
+    winner BOOLEAN,
+    row_key CHAR(64) AS ({ROW_KEY_SQL}) STORED,
+    UNIQUE KEY uq_grammy_row (row_key)
 )
-""")
-
-csv_path = r"data\the_grammy_awards.csv"
-
-with open(csv_path, mode='r', encoding='utf-8-sig') as file:
-    csv_reader = csv.DictReader(file)
-    for row in csv_reader:
-        cursor.execute("""
-            INSERT INTO grammy_awards 
-            (year, title, published_at, updated_at, category, nominee, artist, workers, img, winner)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (
-            int(row['year']),
-            row['title'],
-            row['published_at'], 
-            row['updated_at'],    
-            row['category'],
-            row['nominee'] if row['nominee'] else None,
-            row['artist'] if row['artist'] else None,
-            row['workers'] if row['workers'] else None,
-            row['img'] if row['img'] else None,
-            row['winner'].lower() == 'true'
-        ))
-
-conn.commit()
-cursor.close()
-conn.close()
-
-print("Raw CSV successfully loaded into MySQL.")
+"""
+
+UPSERT_SQL = f"""
+INSERT INTO grammy_awards ({", ".join(COLUMNS)})
+VALUES ({", ".join(["%s"] * len(COLUMNS))})
+ON DUPLICATE KEY UPDATE {", ".join(f"{c} = VALUES({c})" for c in COLUMNS)}
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load the raw Grammy awards CSV into MySQL.")
+    parser.add_argument("csv_path", nargs="?", default=os.path.join("data", "the_grammy_awards.csv"))
+    parser.add_argument("--host", default=os.environ.get("MYSQL_HOST", "localhost"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("MYSQL_PORT", "3306")))
+    parser.add_argument("--user", default=os.environ.get("MYSQL_USER", "root"))
+    parser.add_argument("--password", default=os.environ.get("MYSQL_PASSWORD", ""))
+    parser.add_argument("--database", default=os.environ.get("MYSQL_DATABASE", "grammy_awards"))
+    parser.add_argument("--batch-size", type=int, default=5000, help="rows per executemany call")
+    parser.add_argument("--commit-every", type=int, default=1, help="commit after this many batches")
+    parser.add_argument("--workers", type=int, default=1, help="parallel connections for large files")
+    return parser.parse_args()
+
+
+def connect(args):
+    return mysql.connector.connect(host=args.host, port=args.port, user=args.user,
+                                   password=args.password, database=args.database)
+
+
+def ensure_table(conn):
+    cursor = conn.cursor()
+    cursor.execute(CREATE_SQL)
+
+    # tables created by older versions of this script have no natural key yet; checked step by
+    # step, so a run that stopped halfway through the upgrade finishes it
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = 'grammy_awards' AND column_name = 'row_key'
+    """)
+    if cursor.fetchone()[0] == 0:
+        cursor.execute(f"ALTER TABLE grammy_awards ADD COLUMN row_key CHAR(64) AS ({ROW_KEY_SQL}) STORED")
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = 'grammy_awards' AND index_name = 'uq_grammy_row'
+    """)
+    if cursor.fetchone()[0] == 0:
+        cursor.execute("SELECT COUNT(*) - COUNT(DISTINCT row_key) FROM grammy_awards")
+        duplicates = cursor.fetchone()[0]
+        if duplicates:
+            dedupe_table(cursor, duplicates)
+        else:
+            cursor.execute("ALTER TABLE grammy_awards ADD UNIQUE KEY uq_grammy_row (row_key)")
+    conn.commit()
+    cursor.close()
+
+
+def dedupe_table(cursor, duplicates):
+    # reruns of the old script inserted every row again and the table has no id to tell the
+    # copies apart, so the unique key goes on an empty copy that keeps one row per key (the
+    # most recently updated) and the copy replaces the table
+    print(f"grammy_awards has {duplicates} duplicate rows, rebuilding it with one row per nomination")
+    cursor.execute("DROP TABLE IF EXISTS grammy_awards_dedup")
+    cursor.execute("CREATE TABLE grammy_awards_dedup LIKE grammy_awards")
+    cursor.execute("ALTER TABLE grammy_awards_dedup ADD UNIQUE KEY uq_grammy_row (row_key)")
+    columns = ", ".join(COLUMNS)
+    cursor.execute(f"INSERT IGNORE INTO grammy_awards_dedup ({columns}) "
+                   f"SELECT {columns} FROM grammy_awards ORDER BY updated_at DESC")
+    cursor.execute("RENAME TABLE grammy_awards TO grammy_awards_old, grammy_awards_dedup TO grammy_awards")
+    cursor.execute("DROP TABLE grammy_awards_old")
+
+
+def to_params(row):
+    return (
+        int(row['year']),
+        row['title'],
+        row['published_at'],
+        row['updated_at'],
+        row['category'],
+        row['nominee'] if row['nominee'] else None,
+        row['artist'] if row['artist'] else None,
+        row['workers'] if row['workers'] else None,
+        row['img'] if row['img'] else None,
+        row['winner'].lower() == 'true'
+    )
+
+
+def read_batches(csv_path, batch_size):
+    # streams the file, only one batch per in-flight writer is held in memory
+    with open(csv_path, mode='r', encoding='utf-8-sig', newline='') as file:
+        rows = (to_params(row) for row in csv.DictReader(file))
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return
+            yield batch
+
+
+class Writer:
+    # one connection per thread, each commits its own batches
+
+    def __init__(self, args):
+        self.args = args
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def _conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = connect(self.args)
+            self.local.conn = conn
+            self.local.pending = 0
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    def write(self, batch):
+        conn = self._conn()
+        cursor = conn.cursor()
+        cursor.executemany(UPSERT_SQL, batch)
+        cursor.close()
+        self.local.pending += 1
+        if self.local.pending >= self.args.commit_every:
+            conn.commit()
+            self.local.pending = 0
+        return len(batch)
+
+    def close(self):
+        for conn in self.connections:
+            conn.commit()
+            conn.close()
+
+
+def main():
+    args = parse_args()
+
+    conn = connect(args)
+    ensure_table(conn)
+    conn.close()
+
+    writer = Writer(args)
+    start = time.perf_counter()
+    rows = 0
+    batches = 0
+
+    try:
+        if args.workers <= 1:
+            for batch in read_batches(args.csv_path, args.batch_size):
+                rows += writer.write(batch)
+                batches += 1
+        else:
+            # bounded number of batches in flight keeps memory flat for any file size
+            with ThreadPoolExecutor(max_workers=args.workers) as pool:
+                in_flight = set()
+                for batch in read_batches(args.csv_path, args.batch_size):
+                    if len(in_flight) >= args.workers * 2:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            rows += future.result()
+                            batches += 1
+                    in_flight.add(pool.submit(writer.write, batch))
+                for future in in_flight:
+                    rows += future.result()
+                    batches += 1
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    rate = rows / elapsed if elapsed > 0 else float("inf")
+    print(f"Raw CSV successfully loaded into MySQL: {rows} rows in {batches} batches, "
+          f"{elapsed:.2f}s ({rate:,.0f} rows/s, {args.workers} worker(s)).")
+
+
+if __name__ == "__main__":
+    main()